@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.express as px
+
+import config
+import metrics
+
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+
+
+def results_frame(results):
+    """Flattens search results into one columnar frame with a row per paper."""
+    return pd.DataFrame({
+        'entry_id': [result.entry_id for result in results],
+        'year': [result.published.year for result in results],
+        'category': [result.categories[0] if result.categories else None for result in results],
+        'authors': [[author.name for author in result.authors] for result in results],
+    })
+
+
+def results_key(results):
+    """Identifies a result set by its entry IDs in order."""
+    return hash(tuple(result.entry_id for result in results))
+
+
+# --- Visualization Functions ---
+def create_publication_trends_chart(frame):
+    """Creates a bar chart showing publication trends by year."""
+    if frame.empty:
+        return None
+
+    df = frame['year'].value_counts().sort_index().rename_axis('Year').reset_index(name='Number of Papers')
+
+    fig = px.bar(df, x='Year', y='Number of Papers',
+                 title='Publication Trends by Year',
+                 labels={'Number of Papers': 'Number of Papers', 'Year': 'Publication Year'},
+                 color='Number of Papers',
+                 color_continuous_scale='Blues')
+
+    fig.update_layout(
+        xaxis_tickmode='linear',
+        xaxis_dtick=1,
+        showlegend=False,
+        height=400
+    )
+
+    return fig
+
+
+def create_category_distribution_chart(frame):
+    """Creates a pie chart showing distribution of paper categories."""
+    categories = frame['category'].dropna()
+    if categories.empty:
+        return None
+
+    df = categories.value_counts().rename_axis('Category').reset_index(name='Count')
+
+    fig = px.pie(df, values='Count', names='Category',
+                 title='Distribution by arXiv Category',
+                 hole=0.3)
+
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    fig.update_layout(height=400)
+
+    return fig
+
+
+def create_author_collaboration_chart(frame, top_n=10):
+    """Creates a bar chart showing most frequent authors."""
+    authors = frame['authors'].explode().dropna()
+    if authors.empty:
+        return None
+
+    df = authors.value_counts().head(top_n).rename_axis('Author').reset_index(name='Number of Papers')
+    df = df.sort_values('Number of Papers', ascending=True)
+
+    fig = px.bar(df, x='Number of Papers', y='Author',
+                 title=f'Top {top_n} Most Prolific Authors',
+                 orientation='h',
+                 color='Number of Papers',
+                 color_continuous_scale='Viridis')
+
+    fig.update_layout(height=400, showlegend=False)
+
+    return fig
+
+
+@metrics.timed("chart_building")
+def build_figures(results, frame=None):
+    """Returns the trends, category and author figures for a result set.
+
+    The results are flattened once, or an already flattened `frame` is used,
+    and the figures are memoized per result set so reruns that show the same
+    results reuse them.
+    """
+    key = results_key(results)
+    with _figures_lock:
+        if key in _figures:
+            _figures.move_to_end(key)
+            return _figures[key]
+
+    if frame is None:
+        frame = results_frame(results)
+    figures = {
+        'trends': create_publication_trends_chart(frame),
+        'categories': create_category_distribution_chart(frame),
+        'authors': create_author_collaboration_chart(frame),
+    }
+    with _figures_lock:
+        _figures[key] = figures
+        while len(_figures) > config.ANALYTICS_CACHE_SIZE:
+            _figures.popitem(last=False)
+    return figures
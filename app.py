@@ -1,3 +1,5 @@
+import time
+run_started = time.perf_counter()  # the first run of a process, module imports included, is its startup time
 import streamlit as st
 st.set_page_config(layout="wide", initial_sidebar_state="expanded")
 
@@ -12,150 +14,166 @@ st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 import os
 import json
 import database as db
-import arxiv
+import config
+import search_cache
+import ingest
+import ingest_queue
+import pdf_fetcher
+import pdf_serving
+import paper_store
+import paper_index
+import chat_history
+import chat_log
+import llm
+import multi_qa
+import metrics
 import datetime
+import functools
 import requests
-import base64
-import google.generativeai as genai
-from dotenv import load_dotenv
-from PyPDF2 import PdfReader
-import pandas as pd
-import plotly.express as px
-from collections import Counter
 
 
 
 # --- Configuration ---
-SAVED_PAPERS_DIR = "saved_papers"
+SAVED_PAPERS_DIR = config.SAVED_PAPERS_DIR
+SESSION_COOKIE = "arxiv_session"
 os.makedirs(SAVED_PAPERS_DIR, exist_ok=True)
 
 
 # --- Gemini API Setup ---
 def get_gemini_model():
-    """Initializes and returns the Gemini Pro model."""
-    load_dotenv()
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if api_key:
-        try:
-            genai.configure(api_key=api_key)
-            return genai.GenerativeModel('gemini-2.5-flash')
-        except Exception as e:
-            st.error(f"Failed to configure Gemini API: {e}")
-            return None
-    return None
-
-
-# --- Visualization Functions ---
-def create_publication_trends_chart(results):
-    """Creates a bar chart showing publication trends by year."""
-    if not results:
+    """Returns the process-wide Gemini model, configured on first use."""
+    try:
+        return llm.get_model()
+    except Exception as e:
+        st.error(f"Failed to configure Gemini API: {e}")
         return None
-    
-    # Extract publication years
-    years = []
-    for result in results:
-        year = result.published.year
-        years.append(year)
-    
-    # Count papers per year
-    year_counts = Counter(years)
-    
-    # Create DataFrame
-    df = pd.DataFrame(list(year_counts.items()), columns=['Year', 'Number of Papers'])
-    df = df.sort_values('Year')
-    
-    # Create bar chart
-    fig = px.bar(df, x='Year', y='Number of Papers',
-                 title='Publication Trends by Year',
-                 labels={'Number of Papers': 'Number of Papers', 'Year': 'Publication Year'},
-                 color='Number of Papers',
-                 color_continuous_scale='Blues')
-    
-    fig.update_layout(
-        xaxis_tickmode='linear',
-        xaxis_dtick=1,
-        showlegend=False,
-        height=400
-    )
-    
-    return fig
 
 
-def create_category_distribution_chart(results):
-    """Creates a pie chart showing distribution of paper categories."""
-    if not results:
-        return None
-    
-    # Extract primary categories
-    categories = []
-    for result in results:
-        if result.categories:
-            # Get primary category (first one)
-            primary_cat = result.categories[0]
-            categories.append(primary_cat)
-    
-    if not categories:
-        return None
-    
-    # Count categories
-    cat_counts = Counter(categories)
-    
-    # Create DataFrame
-    df = pd.DataFrame(list(cat_counts.items()), columns=['Category', 'Count'])
-    df = df.sort_values('Count', ascending=False)
-    
-    # Create pie chart
-    fig = px.pie(df, values='Count', names='Category',
-                 title='Distribution by arXiv Category',
-                 hole=0.3)
-    
-    fig.update_traces(textposition='inside', textinfo='percent+label')
-    fig.update_layout(height=400)
-    
-    return fig
+# --- UI Rendering ---
+@st.fragment(run_every=3)
+def show_ingestion_progress(username):
+    """Shows background ingestion progress and reruns the app when papers finish."""
+    counts = ingest_queue.progress(username)
+    total = sum(counts.values())
+    if not total:
+        return
+    finished = counts[ingest_queue.DONE] + counts[ingest_queue.FAILED]
+    st.subheader("Ingestion Queue")
+    st.progress(finished / total, text=f"{counts[ingest_queue.DONE]} of {total} papers saved")
+    st.caption(f"Queued: {counts[ingest_queue.QUEUED]} | Running: {counts[ingest_queue.RUNNING]} | Failed: {counts[ingest_queue.FAILED]}")
+    col1, col2 = st.columns(2)
+    with col1:
+        if counts[ingest_queue.FAILED] and st.button("Retry failed", key="retry_failed_ingestion"):
+            ingest_queue.retry_failed(username)
+    with col2:
+        if finished == total and st.button("Clear", key="clear_ingestion"):
+            ingest_queue.clear_finished(username)
+            st.rerun(scope="app")
+
+    # Rerun the whole app when new papers land so the library listing picks them up
+    if st.session_state.get('ingested_count') != counts[ingest_queue.DONE]:
+        first_check = 'ingested_count' not in st.session_state
+        st.session_state.ingested_count = counts[ingest_queue.DONE]
+        if not first_check:
+            st.rerun(scope="app")
+
+
+@st.fragment(run_every=1)
+def show_search_progress(job):
+    """Shows how many results a running search has fetched and reruns the app as pages arrive."""
+    fetched = len(job.results)
+    if not job.done:
+        st.progress(min(fetched / job.max_results, 1.0), text=f"Fetched {fetched} of up to {job.max_results} papers...")
+    # Rerun the whole app when new results arrive so the analytics and result pages pick them up
+    if st.session_state.get('search_fetched') != (fetched, job.done):
+        first_check = 'search_fetched' not in st.session_state
+        st.session_state.search_fetched = (fetched, job.done)
+        if not first_check:
+            st.rerun(scope="app")
+
+
+def toggle_selection(entry_id, key):
+    """Keeps the set of selected results in step with a result card's checkbox."""
+    if st.session_state[key]:
+        st.session_state.selected_entries.add(entry_id)
+    else:
+        st.session_state.selected_entries.discard(entry_id)
+
+
+def log_in(username):
+    """Starts a session for a user and keeps a signed token in a cookie so reconnects skip the password check."""
+    st.session_state.username = username
+    st.session_state.page = 'retrieval'
+    st.session_state.session_cookie = (db.issue_token(username), config.SESSION_TTL)
+    st.rerun()
+
+
+def log_out():
+    """Ends the session, revokes the user's session tokens and deletes the session cookie."""
+    db.revoke_tokens(st.session_state.username)
+    st.session_state.clear()
+    st.session_state.session_cookie = ("", 0)
+    st.rerun()
+
+
+def restore_session():
+    """Logs a reconnecting client back in from its session cookie, if it holds a valid token."""
+    token = st.context.cookies.get(SESSION_COOKIE)
+    if not isinstance(token, str) or not token:  # no browser request behind the session, e.g. under AppTest
+        return
+    username = db.verify_token(token)
+    if username:
+        st.session_state.username = username
+        st.session_state.page = 'retrieval'
+    else:
+        st.session_state.session_cookie = ("", 0)
 
 
-def create_author_collaboration_chart(results, top_n=10):
-    """Creates a bar chart showing most frequent authors."""
-    if not results:
-        return None
-    
-    # Extract all authors
-    author_names = []
-    for result in results:
-        for author in result.authors:
-            author_names.append(author.name)
-    
-    if not author_names:
-        return None
-    
-    # Count authors
-    author_counts = Counter(author_names)
-    
-    # Get top N authors
-    top_authors = dict(author_counts.most_common(top_n))
-    
-    # Create DataFrame
-    df = pd.DataFrame(list(top_authors.items()), columns=['Author', 'Number of Papers'])
-    df = df.sort_values('Number of Papers', ascending=True)
-    
-    # Create horizontal bar chart
-    fig = px.bar(df, x='Number of Papers', y='Author',
-                 title=f'Top {top_n} Most Prolific Authors',
-                 orientation='h',
-                 color='Number of Papers',
-                 color_continuous_scale='Viridis')
-    
-    fig.update_layout(height=400, showlegend=False)
-    
-    return fig
+def write_session_cookie():
+    """Sets or deletes the session cookie requested by log_in, log_out or restore_session.
 
+    Streamlit can only read cookies, so the cookie is written by a script in an
+    empty iframe. Keeping the token out of the URL keeps it out of browser
+    history, shared links and proxy logs.
+    """
+    if 'session_cookie' not in st.session_state:
+        return
+    token, max_age = st.session_state.pop('session_cookie')
+    st.iframe(f"""<script>
+        const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+        window.parent.document.cookie = "{SESSION_COOKIE}={token}; Path=/; Max-Age={max_age}; SameSite=Strict" + secure;
+    </script>""", height="content")
+
+
+def show_diagnostics():
+    """Shows an admin-only panel with stage latencies, process resources and cache statistics."""
+    with st.sidebar.expander("Diagnostics"):
+        # Sampling here would reset the CPU interval the background sampler measures over
+        process = metrics.latest()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("RSS", f"{process['rss_bytes'] / 2 ** 20:.0f} MB")
+        col2.metric("Peak RSS", f"{process['peak_rss_bytes'] / 2 ** 20:.0f} MB")
+        col3.metric("CPU", f"{process['cpu_percent']:.0f}%")
+        stages = metrics.stage_stats()
+        if stages:
+            st.dataframe([
+                {'stage': name, 'count': stats['count'], 'errors': stats['errors'],
+                 'p50 ms': round(stats['p50'] * 1000, 1), 'p95 ms': round(stats['p95'] * 1000, 1),
+                 'max ms': round(stats['max'] * 1000, 1)}
+                for name, stats in stages.items()
+            ], hide_index=True)
+        history = metrics.resource_history()
+        if history:
+            st.line_chart({'RSS MB': [rss / 2 ** 20 for _, rss, _ in history]}, height=120)
+        st.caption(f"Search cache: {search_cache.cache.stats()}")
+        st.caption(f"Gemini cache: {llm.cache_stats()}")
+        st.download_button("Metrics (Prometheus)", metrics.to_prometheus, file_name="metrics.prom",
+                           mime="text/plain", key="download_metrics_prom")
+        st.download_button("Metrics (JSON)", lambda: json.dumps(metrics.snapshot(), indent=2), file_name="metrics.json",
+                           mime="application/json", key="download_metrics_json")
 
-# --- UI Rendering ---
-def show_login_signup():
-    conn = db.create_connection()
-    db.create_table(conn)
 
+def show_login_signup():
     st.markdown("<h1 style='text-align: center;'>Welcome to the Research Paper AI</h1>", unsafe_allow_html=True)
     
     col1, col2, col3 = st.columns([1,1.5,1])
@@ -171,12 +189,10 @@ def show_login_signup():
                 if st.button("Sign Up"):
                     if not new_username or not new_password:
                         st.error("Username and password cannot be empty.")
-                    elif db.add_user(conn, new_username.lower(), new_password):
+                    elif db.add_user(new_username.lower(), new_password):
                         user_folder = os.path.join(SAVED_PAPERS_DIR, new_username.lower())
                         os.makedirs(user_folder, exist_ok=True)
-                        st.session_state.username = new_username.lower()
-                        st.session_state.page = 'retrieval'
-                        st.rerun()
+                        log_in(new_username.lower())
                     else:
                         st.error("Username already exists.")
 
@@ -185,106 +201,260 @@ def show_login_signup():
                 username = st.text_input("Username")
                 password = st.text_input("Password", type="password")
                 if st.button("Login"):
-                    if db.check_user(conn, username.lower(), password):
-                        st.session_state.username = username.lower()
-                        st.session_state.page = 'retrieval'
-                        st.rerun()
+                    if db.check_user(username.lower(), password):
+                        log_in(username.lower())
                     else:
                         st.error("Invalid username or password.")
 
+def open_paper(username, safe_title):
+    """Loads a saved paper and its chat history into the session and opens the chat page."""
+    paper = paper_store.load_paper(username, safe_title)
+    if paper is None:
+        st.error("Could not load the saved paper.")
+        return
+    st.session_state.selected_paper = paper
+    st.session_state.page = 'chat'
+    if 'messages' in st.session_state: del st.session_state['messages']
+    st.session_state.chat_summary = chat_history.new_summary_state()
+
+    # Load the most recent part of the chat history; older messages are paged in on demand
+    chat_filepath = paper_store.chat_path(username, safe_title)
+    chat_log.migrate_json(paper_store.legacy_chat_path(username, safe_title), chat_filepath)
+    st.session_state.history_start, st.session_state.messages = chat_log.read_tail(chat_filepath, config.CHAT_LOAD_LAST)
+
+    st.rerun()
+
+
+def set_session_value(key, value):
+    """Widget callback that stores a value in the session state before the rerun."""
+    st.session_state[key] = value
+
+
+@st.fragment
+@metrics.timed("sidebar_listing")
+def show_library_sidebar(username, key_prefix):
+    """Lists the user's saved papers with open, download and delete actions.
+
+    Call it inside `with st.sidebar:`. It runs as a fragment, so filtering and
+    paging the listing don't rerun the rest of the page.
+    """
+    st.subheader("Your Saved Papers:")
+    papers = paper_store.list_papers(username)
+    if not papers:
+        st.write("No papers saved yet.")
+        return
+
+    title_filter = st.text_input("Filter papers", key=f"library_filter_{key_prefix}", placeholder="Filter by title")
+    if title_filter:
+        needle = title_filter.lower()
+        papers = [paper for paper in papers if needle in paper['title'].lower()]
+
+    page_count = max(1, -(-len(papers) // config.LIBRARY_PAGE_SIZE))
+    page = min(st.session_state.get('library_page', 0), page_count - 1)
+    start = page * config.LIBRARY_PAGE_SIZE
+
+    for paper in papers[start:start + config.LIBRARY_PAGE_SIZE]:
+        title = paper['safe_title']
+        col1, col2, col3 = st.columns([0.6, 0.2, 0.2])
+        with col1:
+            if st.button(title, key=f"sidebar_{key_prefix}_{title}"):
+                open_paper(username, title)
+        with col2:
+            if paper['has_pdf']:
+                st.download_button("⬇️", functools.partial(paper_store.read_pdf, username, title),
+                                   file_name=f"{title}.pdf", mime="application/pdf", key=f"download_{key_prefix}_{title}")
+        with col3:
+            if st.button("🗑️", key=f"delete_{key_prefix}_{title}"):
+                paper_store.delete_paper(username, title)
+                # Result cards show which papers are saved, so the whole page reruns
+                st.rerun()
+
+    if page_count > 1:
+        col1, col2, col3 = st.columns([0.3, 0.4, 0.3])
+        with col1:
+            st.button("◀", key=f"library_prev_{key_prefix}", disabled=page == 0,
+                      on_click=set_session_value, args=('library_page', page - 1))
+        with col2:
+            st.caption(f"Page {page + 1} of {page_count}")
+        with col3:
+            st.button("▶", key=f"library_next_{key_prefix}", disabled=page >= page_count - 1,
+                      on_click=set_session_value, args=('library_page', page + 1))
+
+
+@st.fragment
+def show_search_analytics(results, frame):
+    """Shows the trends, category and author charts of a result set."""
+    import analytics
+
+    st.subheader("Search Results Analytics")
+    
+    figures = analytics.build_figures(results, frame)
+
+    # Create three columns for different charts
+    viz_col1, viz_col2 = st.columns(2)
+    
+    with viz_col1:
+        # Publication trends chart
+        if figures['trends']:
+            st.plotly_chart(figures['trends'], use_container_width=True)
+        else:
+            st.info("No data available for publication trends.")
+    
+    with viz_col2:
+        # Category distribution chart
+        if figures['categories']:
+            st.plotly_chart(figures['categories'], use_container_width=True)
+        else:
+            st.info("No data available for category distribution.")
+    
+    # Author collaboration chart (full width)
+    if figures['authors']:
+        st.plotly_chart(figures['authors'], use_container_width=True)
+    else:
+        st.info("No data available for author analysis.")
+
+
+@st.fragment
+def show_result_card(username, result, i, is_saved, queue_status, related):
+    """Shows one search result with related saved papers. Selecting it reruns only this card."""
+    with st.container(border=True):
+        col1, col2, col3 = st.columns([0.7, 0.15, 0.15])
+        with col1:
+            st.subheader(result.title)
+            st.write(f"**Authors:** {', '.join(a.name for a in result.authors)}")
+            st.caption(f"Published: {result.published.strftime('%Y-%m-%d')} | Category: {result.categories[0] if result.categories else 'N/A'}")
+            duplicates = [] if is_saved else [hit['title'] for hit in related if hit['duplicate']]
+            if duplicates:
+                st.warning(f"Possibly already in your library as: {'; '.join(duplicates)}")
+            others = [hit['title'] for hit in related if hit['title'] not in duplicates]
+            if others:
+                st.caption(f"Related in your library: {' · '.join(others)}")
+
+        with col2:
+            if is_saved:
+                st.button("Saved", key=f"saved_{result.entry_id}_{i}", disabled=True)
+            elif queue_status in (ingest_queue.QUEUED, ingest_queue.RUNNING):
+                st.button(queue_status.capitalize(), key=f"queued_{result.entry_id}_{i}", disabled=True)
+            else:
+                if st.button("Save", key=f"save_{result.entry_id}_{i}"):
+                    model = get_gemini_model()
+                    if model:
+                        with st.spinner("Saving, this may take a moment..."):
+                            try:
+                                ingest.save_paper(model, ingest.paper_from_result(result), username)
+                                st.success(f"Saved and analyzed '{result.title}'")
+                                # The library sidebar and saved markers depend on this, so the whole page reruns
+                                st.rerun()
+                            except Exception as e:
+                                st.warning(f"Could not download or process PDF for '{result.title}': {e}")
+                    else:
+                        st.error("Please enter your Gemini API key in the .env file.")
+        with col3:
+            if not is_saved and queue_status not in (ingest_queue.QUEUED, ingest_queue.RUNNING):
+                select_key = f"select_{result.entry_id}_{i}"
+                st.checkbox("Select", key=select_key, value=result.entry_id in st.session_state.selected_entries,
+                            on_change=toggle_selection, args=(result.entry_id, select_key))
+
+
+@st.fragment
+def show_result_list(username, results):
+    """Shows a page of result cards with bulk save actions. Paging reruns only the list."""
+    st.subheader("Paper Details")
+
+    # Get a list of saved paper titles
+    saved_paper_titles = paper_store.saved_titles(username)
+    
+    queue_statuses = ingest_queue.statuses(username)
+    selected_entries = st.session_state.setdefault('selected_entries', set())
+    col1, col2, _ = st.columns([0.2, 0.2, 0.6])
+    with col1:
+        save_selected = st.button("Save selected", key="save_selected")
+    with col2:
+        save_all = st.button(f"Save all results ({len(results)})", key="save_all")
+    if save_selected or save_all:
+        to_save = [
+            ingest.paper_from_result(result)
+            for result in results
+            if ingest.safe_filename(result.title) not in saved_paper_titles
+            and (save_all or result.entry_id in selected_entries)
+        ]
+        queued = ingest_queue.enqueue(username, to_save)
+        st.toast(f"Queued {queued} papers for saving.")
+        selected_entries.clear()
+        queue_statuses = ingest_queue.statuses(username)
+
+    page_count = max(1, -(-len(results) // config.RESULTS_PAGE_SIZE))
+    page = min(st.session_state.get('results_page', 0), page_count - 1)
+    start = page * config.RESULTS_PAGE_SIZE
+
+    page_results = results[start:start + config.RESULTS_PAGE_SIZE]
+    related = paper_store.related_papers(username, [
+        {'title': result.title, 'abstract': result.summary, 'entry_id': result.entry_id,
+         'safe_title': ingest.safe_filename(result.title)}
+        for result in page_results
+    ])
+    for i, (result, result_related) in enumerate(zip(page_results, related), start):
+        show_result_card(username, result, i, ingest.safe_filename(result.title) in saved_paper_titles,
+                         queue_statuses.get(result.entry_id), result_related)
+
+    if page_count > 1:
+        col1, col2, col3 = st.columns([0.2, 0.6, 0.2])
+        with col1:
+            st.button("◀ Previous", key="results_prev", disabled=page == 0,
+                      on_click=set_session_value, args=('results_page', page - 1))
+        with col2:
+            st.caption(f"Page {page + 1} of {page_count} ({len(results)} papers)")
+        with col3:
+            st.button("Next ▶", key="results_next", disabled=page >= page_count - 1,
+                      on_click=set_session_value, args=('results_page', page + 1))
+
+
 def show_retrieval_page():
     if 'username' not in st.session_state:
         st.session_state.page = 'login'
         st.rerun()
         return
+    # arXiv, pandas and Plotly load with the first retrieval page, not at login
+    import arxiv
+    import arxiv_search
+
     st.title("Paper Retrieval")
+    ingest_queue.start_workers()
     
     # --- Sidebar ---
     username = st.session_state.username
-    user_folder = os.path.join(SAVED_PAPERS_DIR, username)
-    st.sidebar.subheader("Your Saved Papers:")
-    if os.path.exists(user_folder):
-        saved_files = [f for f in os.listdir(user_folder) if not f.endswith('.chat.json')]
-        paper_titles = sorted(list(set([os.path.splitext(f)[0] for f in saved_files])))
-        if paper_titles:
-            for title in paper_titles:
-                col1, col2, col3 = st.sidebar.columns([0.6, 0.2, 0.2])
-                with col1:
-                    if st.button(title, key=f"sidebar_retrieval_{title}"):
-                        txt_path = os.path.join(user_folder, f"{title}.txt")
-                        pdf_path = os.path.join(user_folder, f"{title}.pdf")
-                        
-                        if os.path.exists(txt_path):
-                            with open(txt_path, "r") as f:
-                                content = f.read()
-                            try:
-                                # Extract data from the text file
-                                title_from_file = content.split("\n")[0].replace("Title: ", "")
-                                authors_str = content.split("\n")[1].replace("Authors: ", "")
-                                authors = authors_str.split(", ")
-                                pdf_url_from_file = content.split("\n")[2].replace("PDF_URL: ", "")
-                                summary = content.split("--- Summary ---")[1].split("--- Drawbacks ---")[0].strip()
-                                drawbacks = content.split("--- Drawbacks ---")[1].split("--- Full Text ---")[0].strip()
-                                full_text = content.split("--- Full Text ---")[1].strip()
-
-                                st.session_state.selected_paper = {
-                                    'title': title_from_file,
-                                    'summary': summary,
-                                    'authors': authors,
-                                    'published': 'N/A', # This info is not in the txt
-                                    'pdf_url': pdf_url_from_file,
-                                    'drawbacks': drawbacks,
-                                    'full_text': full_text
-                                }
-                                if os.path.exists(pdf_path):
-                                    st.session_state.selected_paper['pdf_local_path'] = pdf_path
-
-                                st.session_state.page = 'chat'
-                                if 'messages' in st.session_state: del st.session_state['messages']
-
-                                # Load chat history if it exists
-                                safe_title = "".join(c for c in title_from_file if c.isalnum() or c in (' ', '_')).rstrip()
-                                chat_filename = f"{safe_title}.chat.json"
-                                chat_filepath = os.path.join(user_folder, chat_filename)
-                                if os.path.exists(chat_filepath):
-                                    with open(chat_filepath, "r") as f:
-                                        st.session_state.messages = json.load(f)
-                                else:
-                                    st.session_state.messages = []
-
-                                st.rerun()
-
-                            except IndexError:
-                                st.error("Could not parse the saved paper file.")
-                with col2:
-                    pdf_path = os.path.join(user_folder, f"{title}.pdf")
-                    if os.path.exists(pdf_path):
-                        with open(pdf_path, "rb") as f:
-                            st.download_button("⬇️", f, file_name=f"{title}.pdf", key=f"download_retrieval_{title}")
-                with col3:
-                    if st.button("🗑️", key=f"delete_retrieval_{title}"):
-                        txt_path = os.path.join(user_folder, f"{title}.txt")
-                        pdf_path = os.path.join(user_folder, f"{title}.pdf")
-                        chat_path = os.path.join(user_folder, f"{title}.chat.json")
-                        if os.path.exists(txt_path):
-                            os.remove(txt_path)
-                        if os.path.exists(pdf_path):
-                            os.remove(pdf_path)
-                        if os.path.exists(chat_path):
-                            os.remove(chat_path)
-                        st.rerun()
-        else:
-            st.sidebar.write("No papers saved yet.")
+    if not st.session_state.get('library_migrated'):
+        paper_store.migrate_txt_library(username)
+        st.session_state.library_migrated = True
+    if st.sidebar.button("Ask Across Papers", key="open_compare"):
+        st.session_state.page = 'compare'
+        st.rerun()
+    with st.sidebar:
+        show_library_sidebar(username, "retrieval")
             
     col1, col2 = st.sidebar.columns(2)
     with col1:
         st.write(f"Hello, {username}")
     with col2:
         if st.button("Logout", key="logout_retrieval"):
-            st.session_state.clear()
-            st.rerun()
+            log_out()
+    with st.sidebar:
+        show_ingestion_progress(username)
+    if username in config.ADMIN_USERS:
+        show_diagnostics()
 
     # --- Main Page Content ---
+    with st.expander("Search Your Library"):
+        library_query = st.text_input("Search titles, authors, summaries and full text", key="library_query")
+        if library_query:
+            matches = paper_store.search_library(username, library_query)
+            if not matches:
+                st.write("No saved papers match your search.")
+            for match in matches:
+                if st.button(match['title'], key=f"library_match_{match['safe_title']}"):
+                    open_paper(username, match['safe_title'])
+                st.caption(match['snippet'])
+
     st.write(f"Welcome, {st.session_state.username}! Find papers on arXiv.")
     with st.form(key='search_form'):
         search_query = st.text_input("Search for papers", "quantum computing")
@@ -297,7 +467,7 @@ def show_retrieval_page():
 
         col3, col4 = st.columns(2)
         with col3:
-            max_results = st.number_input("Number of papers", 1, 100, 10)
+            max_results = st.number_input("Number of papers", 1, config.MAX_SEARCH_RESULTS, 10)
         with col4:
             sort_options = {
                 "Relevance": arxiv.SortCriterion.Relevance,
@@ -310,113 +480,156 @@ def show_retrieval_page():
         submit_button = st.form_submit_button(label='Search')
 
     if submit_button:
-        final_query = search_query
-        if start_date and end_date:
-            date_query = f'submittedDate:[{start_date.strftime("%Y%m%d")} TO {end_date.strftime("%Y%m%d")}]'
-            final_query = f'({search_query}) AND {date_query}'
-        
-        client = arxiv.Client()
-        search = arxiv.Search(query=final_query, max_results=max_results, sort_by=sort_by)
-        results = list(client.results(search))
+        st.session_state.search_job = arxiv_search.start_search(search_query, start_date, end_date, max_results, sort_by)
+        st.session_state.results_page = 0
+        st.session_state.selected_entries = set()
+        if 'search_fetched' in st.session_state: del st.session_state['search_fetched']
+
+    if 'search_job' in st.session_state:
+        job = st.session_state.search_job
+        done = job.done  # read before the view, so a finished job's view holds all its results
+        results, frame = job.view()
         st.session_state.search_results = results
+        if submit_button and job.from_cache:
+            st.caption("Results served from cache.")
+        # Polling stops once the job is done and its final results have been rerun into the page
+        if not done or not st.session_state.get('search_fetched', (None, True))[1]:
+            show_search_progress(job)
+        if job.error:
+            st.error(f"arXiv search stopped after {len(results)} papers: {job.error}")
 
-    if 'search_results' in st.session_state:
         # --- Visualization Section ---
-        st.subheader("Search Results Analytics")
-        
-        # Create three columns for different charts
-        viz_col1, viz_col2 = st.columns(2)
-        
-        with viz_col1:
-            # Publication trends chart
-            trends_chart = create_publication_trends_chart(st.session_state.search_results)
-            if trends_chart:
-                st.plotly_chart(trends_chart, use_container_width=True)
-            else:
-                st.info("No data available for publication trends.")
-        
-        with viz_col2:
-            # Category distribution chart
-            category_chart = create_category_distribution_chart(st.session_state.search_results)
-            if category_chart:
-                st.plotly_chart(category_chart, use_container_width=True)
-            else:
-                st.info("No data available for category distribution.")
-        
-        # Author collaboration chart (full width)
-        author_chart = create_author_collaboration_chart(st.session_state.search_results)
-        if author_chart:
-            st.plotly_chart(author_chart, use_container_width=True)
-        else:
-            st.info("No data available for author analysis.")
+        show_search_analytics(results, frame)
         
         st.divider()
         
         # --- Search Results List ---
-        st.subheader("Paper Details")
-
-        # Get a list of saved paper titles
-        saved_paper_titles = []
-        if os.path.exists(user_folder):
-            saved_files = os.listdir(user_folder)
-            saved_paper_titles = [os.path.splitext(f)[0] for f in saved_files]
-        
-        for i, result in enumerate(st.session_state.search_results):
-            with st.container(border=True):
-                col1, col2, col3 = st.columns([0.7, 0.15, 0.15])
-                with col1:
-                    st.subheader(result.title)
-                    st.write(f"**Authors:** {', '.join(a.name for a in result.authors)}")
-                    st.caption(f"Published: {result.published.strftime('%Y-%m-%d')} | Category: {result.categories[0] if result.categories else 'N/A'}")
-                
-                safe_title = "".join(c for c in result.title if c.isalnum() or c in (' ', '_')).rstrip()
-                is_saved = safe_title in saved_paper_titles
-
-                with col2:
-                    if is_saved:
-                        st.button("Saved", key=f"saved_{result.entry_id}_{i}", disabled=True)
-                    else:
-                        if st.button("Save", key=f"save_{result.entry_id}_{i}"):
-                            model = get_gemini_model()
-                            if model:
-                                with st.spinner("Saving, this may take a moment..."):
-                                    # --- Create user folder if it doesn't exist ---
-                                    os.makedirs(user_folder, exist_ok=True)
-
-                                    # --- Generate Summary ---
-                                    summary_response = model.generate_content(f"Summarize this research paper: {result.summary}")
-                                    gemini_summary = summary_response.text
-
-                                    # --- Find Drawbacks ---
-                                    drawbacks_response = model.generate_content(f"Analyze this research paper and identify its limitations and drawbacks: {result.summary}")
-                                    gemini_drawbacks = drawbacks_response.text
-
-                                    # --- Save PDF and Extract Text ---
-                                    try:
-                                        pdf_response = requests.get(result.pdf_url)
-                                        pdf_response.raise_for_status()
-                                        paper_filename_pdf = f"{safe_title}.pdf"
-                                        pdf_path = os.path.join(user_folder, paper_filename_pdf)
-                                        with open(pdf_path, "wb") as f:
-                                            f.write(pdf_response.content)
-
-                                        # --- Extract Text from PDF ---
-                                        with open(pdf_path, "rb") as f:
-                                            reader = PdfReader(f)
-                                            full_text = "".join(page.extract_text() for page in reader.pages)
-
-                                        # --- Save Text File ---
-                                        paper_content = f"Title: {result.title}\nAuthors: {', '.join(a.name for a in result.authors)}\nPDF_URL: {result.pdf_url}\n\n--- Summary ---\n{gemini_summary}\n\n--- Drawbacks ---\n{gemini_drawbacks}\n\n--- Full Text ---\n{full_text}"
-                                        paper_filename_txt = f"{safe_title}.txt"
-                                        with open(os.path.join(user_folder, paper_filename_txt), "w") as f:
-                                            f.write(paper_content)
-
-                                        st.success(f"Saved and analyzed '{result.title}'")
-                                        st.rerun()
-                                    except Exception as e:
-                                        st.warning(f"Could not download or process PDF for '{result.title}': {e}")
-                            else:
-                                st.error("Please enter your Gemini API key in the .env file.")
+        show_result_list(username, results)
+
+
+@st.fragment
+def show_pdf_viewer(paper):
+    """Shows the paper's PDF. As a fragment it isn't re-sent when the chat reruns."""
+    st.markdown("##### Paper PDF")
+    # The viewer URL is resolved once per opened paper, so reruns only re-send the iframe tag
+    if 'pdf_view_src' not in paper:
+        pdf_path = None
+        # --- Try the local PDF first ---
+        if paper.get('pdf_local_path'):
+            if os.path.exists(paper['pdf_local_path']):
+                pdf_path = paper['pdf_local_path']
+            else:
+                st.warning("Saved PDF not found. Trying to fetch from URL.")
+        # --- Fall back to the cached remote copy ---
+        if pdf_path is None and paper['pdf_url']:
+            try:
+                pdf_path = pdf_fetcher.fetch_pdf(paper['pdf_url'])
+            except requests.exceptions.RequestException as e:
+                st.error(f"Failed to load PDF from URL: {e}")
+        if pdf_path is not None:
+            try:
+                if st.get_option("server.enableStaticServing"):
+                    paper['pdf_view_src'] = pdf_serving.publish(pdf_path)
+                else:
+                    paper['pdf_view_src'] = pdf_serving.data_uri(pdf_path)
+            except Exception as e:
+                st.error(f"An error occurred while loading the PDF: {e}")
+
+    if paper.get('pdf_view_src'):
+        pdf_display = f'<iframe src="{paper["pdf_view_src"]}" width="100%" height="400" type="application/pdf"></iframe>'
+        st.markdown(pdf_display, unsafe_allow_html=True)
+    elif not paper['pdf_url'] and not paper.get('pdf_local_path'):
+        st.info("No PDF available for this paper.")
+
+
+def clear_chat(chat_filepath):
+    st.session_state.messages = []
+    st.session_state.chat_summary = chat_history.new_summary_state()
+    # Also delete the chat history file
+    chat_log.clear(chat_filepath)
+    st.session_state.history_start = 0
+
+
+def load_earlier_messages(chat_filepath):
+    history_start = st.session_state.get('history_start', 0)
+    new_start = max(0, history_start - config.CHAT_LOAD_LAST)
+    older = chat_log.read_range(chat_filepath, new_start, history_start)
+    st.session_state.messages = older + st.session_state.messages
+    st.session_state.chat_summary['covered'] += len(older)
+    st.session_state.history_start = new_start
+
+
+def submit_prompt(chat_filepath):
+    prompt = st.session_state.chat_prompt
+    if prompt:
+        st.session_state.messages.append({"role": "user", "content": prompt})
+        chat_log.append(chat_filepath, st.session_state.messages[-1])
+
+
+@st.fragment
+def show_chat_panel(username, paper):
+    """Shows the chat about a paper. Sending a question reruns only this panel."""
+    st.markdown("##### Chat")
+
+    if "messages" not in st.session_state:
+        st.session_state.messages = []
+    if "chat_summary" not in st.session_state:
+        st.session_state.chat_summary = chat_history.new_summary_state()
+
+    chat_filepath = paper_store.chat_path(username, paper['safe_title'])
+
+    st.button("Clear Chat", key="clear_chat_button", on_click=clear_chat, args=(chat_filepath,))
+
+    with st.container(height=350, border=True):
+        if st.session_state.get('history_start', 0) > 0:
+            st.button("Load earlier messages", key="load_earlier_messages",
+                      on_click=load_earlier_messages, args=(chat_filepath,))
+
+        for message in st.session_state.messages:
+            role = message["role"]
+            if role == "model":
+                role = "assistant"
+            with st.chat_message(role):
+                st.markdown(message["content"])
+
+        if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                full_response = ""
+                model = get_gemini_model()
+                if model:
+                    started = time.perf_counter()
+                    index = paper_store.load_index(username, paper['safe_title'])
+                    excerpts = paper_index.retrieve(index, st.session_state.messages[-1]["content"])
+                    context = "\n\n[...]\n\n".join(excerpts)
+                    summary, recent_messages = chat_history.window_history(model, st.session_state.messages, st.session_state.chat_summary)
+                    preamble = f"Here is the paper I am asking about:\n\nTitle: {paper['title']}\n\nExcerpts most relevant to my question:\n{context} "
+                    if summary:
+                        preamble += f"\n\nSummary of our earlier conversation:\n{summary}"
+                    history = []
+                    history.append({"role": "user", "parts": [preamble]})
+                    for msg in recent_messages:
+                        role = msg["role"]
+                        if role == "assistant":
+                            role = "model"
+                        history.append({"role": role, "parts": [msg["content"]]})
+
+                    stream = llm.generate(model, history, stream=True)
+                    for chunk_text in metrics.timed_stream(stream, "chat_stream", "chat_first_token", start=started):
+                        full_response += chunk_text
+                        placeholder.markdown(full_response + "▌")
+                    placeholder.markdown(full_response)
+                    st.session_state.messages.append({"role": "model", "content": full_response})
+                else:
+                    full_response = "Please enter your Gemini API key to use the chat."
+                    placeholder.markdown(full_response)
+                    st.session_state.messages.append({"role": "model", "content": full_response})
+
+                # Append the reply to the chat log
+                chat_log.append(chat_filepath, st.session_state.messages[-1])
+
+    # The question is appended by the callback, so this run already shows it and streams the reply
+    st.chat_input("Ask questions about the paper...", key="chat_prompt", on_submit=submit_prompt, args=(chat_filepath,))
 
 
 def show_chat_page():
@@ -432,82 +645,12 @@ def show_chat_page():
         st.session_state.page = 'retrieval'
         if 'selected_paper' in st.session_state: del st.session_state['selected_paper']
         if 'search_results' in st.session_state: del st.session_state['search_results']
+        if 'search_job' in st.session_state: del st.session_state['search_job']
         if 'messages' in st.session_state: del st.session_state['messages']
         st.rerun()
         
-    st.sidebar.subheader("Your Saved Papers:")
-    user_folder = os.path.join(SAVED_PAPERS_DIR, username)
-    if os.path.exists(user_folder):
-        saved_files = [f for f in os.listdir(user_folder) if not f.endswith('.chat.json')]
-        paper_titles = sorted(list(set([os.path.splitext(f)[0] for f in saved_files])))
-        if paper_titles:
-            for title in paper_titles:
-                col1, col2, col3 = st.sidebar.columns([0.6, 0.2, 0.2])
-                with col1:
-                    if st.button(title, key=f"sidebar_chat_{title}"):
-                        txt_path = os.path.join(user_folder, f"{title}.txt")
-                        pdf_path = os.path.join(user_folder, f"{title}.pdf")
-                        
-                        if os.path.exists(txt_path):
-                            with open(txt_path, "r") as f:
-                                content = f.read()
-                            try:
-                                title_from_file = content.split("\n")[0].replace("Title: ", "")
-                                authors_str = content.split("\n")[1].replace("Authors: ", "")
-                                authors = authors_str.split(", ")
-                                pdf_url_from_file = content.split("\n")[2].replace("PDF_URL: ", "")
-                                summary = content.split("--- Summary ---")[1].split("--- Drawbacks ---")[0].strip()
-                                drawbacks = content.split("--- Drawbacks ---")[1].split("--- Full Text ---")[0].strip()
-                                full_text = content.split("--- Full Text ---")[1].strip()
-
-                                st.session_state.selected_paper = {
-                                    'title': title_from_file,
-                                    'summary': summary,
-                                    'authors': authors,
-                                    'published': 'N/A',
-                                    'pdf_url': pdf_url_from_file,
-                                    'drawbacks': drawbacks,
-                                    'full_text': full_text
-                                }
-                                
-                                if os.path.exists(pdf_path):
-                                    st.session_state.selected_paper['pdf_local_path'] = pdf_path
-
-                                if 'messages' in st.session_state: del st.session_state['messages']
-
-                                # Load chat history if it exists
-                                safe_title = "".join(c for c in title_from_file if c.isalnum() or c in (' ', '_')).rstrip()
-                                chat_filename = f"{safe_title}.chat.json"
-                                chat_filepath = os.path.join(user_folder, chat_filename)
-                                if os.path.exists(chat_filepath):
-                                    with open(chat_filepath, "r") as f:
-                                        st.session_state.messages = json.load(f)
-                                else:
-                                    st.session_state.messages = []
-
-                                st.rerun()
-
-                            except IndexError:
-                                st.error("Could not parse the saved paper file.")
-                with col2:
-                    pdf_path = os.path.join(user_folder, f"{title}.pdf")
-                    if os.path.exists(pdf_path):
-                        with open(pdf_path, "rb") as f:
-                            st.download_button("⬇️", f, file_name=f"{title}.pdf", key=f"download_chat_{title}")
-                with col3:
-                    if st.button("🗑️", key=f"delete_chat_{title}"):
-                        txt_path = os.path.join(user_folder, f"{title}.txt")
-                        pdf_path = os.path.join(user_folder, f"{title}.pdf")
-                        chat_path = os.path.join(user_folder, f"{title}.chat.json")
-                        if os.path.exists(txt_path):
-                            os.remove(txt_path)
-                        if os.path.exists(pdf_path):
-                            os.remove(pdf_path)
-                        if os.path.exists(chat_path):
-                            os.remove(chat_path)
-                        st.rerun()
-        else:
-            st.sidebar.write("No papers saved yet.")
+    with st.sidebar:
+        show_library_sidebar(username, "chat")
     
     st.sidebar.write("---") # Using a divider for better separation
     
@@ -516,8 +659,11 @@ def show_chat_page():
         st.write(f"Hello, {username}")
     with col2:
         if st.button("Logout", key="logout_chat"):
-            st.session_state.clear()
-            st.rerun()
+            log_out()
+    with st.sidebar:
+        show_ingestion_progress(username)
+    if username in config.ADMIN_USERS:
+        show_diagnostics()
 
 
     # --- Main Page Content ---
@@ -530,120 +676,148 @@ def show_chat_page():
     with st.expander("View Paper Drawbacks"):
         st.write(paper['drawbacks'])
     
+    related = paper_store.related_papers(username, [paper])[0]
+    if related:
+        with st.expander("Related Saved Papers"):
+            for hit in related:
+                label = f"{hit['title']} (possible duplicate)" if hit['duplicate'] else hit['title']
+                if st.button(label, key=f"related_{hit['safe_title']}"):
+                    open_paper(username, hit['safe_title'])
+
     st.divider()
 
     left_col, right_col = st.columns(2)
 
     # --- Left Column: PDF Viewer ---
     with left_col:
-        st.markdown("##### Paper PDF")
-        pdf_displayed = False
-        # --- Try to load local PDF first ---
-        if 'pdf_local_path' in paper and paper['pdf_local_path']:
-            try:
-                with open(paper['pdf_local_path'], "rb") as f:
-                    pdf_bytes = f.read()
-                base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-                pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="400" type="application/pdf"></iframe>'
-                st.markdown(pdf_display, unsafe_allow_html=True)
-                pdf_displayed = True
-            except FileNotFoundError:
-                st.warning("Saved PDF not found. Trying to fetch from URL.")
-            except Exception as e:
-                st.error(f"An error occurred while loading the local PDF: {e}")
-
-        # --- Fallback to URL if local PDF not displayed ---
-        if not pdf_displayed and paper['pdf_url']:
-            try:
-                response = requests.get(paper['pdf_url'])
-                response.raise_for_status()
-                pdf_bytes = response.content
-                base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-                pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="5000" type="application/pdf"></iframe>'
-                st.markdown(pdf_display, unsafe_allow_html=True)
-            except requests.exceptions.RequestException as e:
-                st.error(f"Failed to load PDF from URL: {e}")
-            except Exception as e:
-                st.error(f"An error occurred: {e}")
-        elif not pdf_displayed:
-            st.info("No PDF available for this paper.")
+        show_pdf_viewer(paper)
 
     # --- Right Column: Chat Interface ---
     with right_col:
-        st.markdown("##### Chat")
-
-        if st.button("Clear Chat", key="clear_chat_button"):
-            if 'messages' in st.session_state:
-                st.session_state.messages = []
-            # Also delete the chat history file
-            safe_title = "".join(c for c in paper['title'] if c.isalnum() or c in (' ', '_')).rstrip()
-            chat_filename = f"{safe_title}.chat.json"
-            chat_filepath = os.path.join(SAVED_PAPERS_DIR, username, chat_filename)
-            if os.path.exists(chat_filepath):
-                os.remove(chat_filepath)
-            st.rerun()
-
-        if "messages" not in st.session_state:
-            st.session_state.messages = []
-
-        with st.container(height=350, border=True):
-            for message in st.session_state.messages:
-                role = message["role"]
-                if role == "model":
-                    role = "assistant"
-                with st.chat_message(role):
-                    st.markdown(message["content"])
-
-            if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-                with st.chat_message("assistant"):
-                    placeholder = st.empty()
-                    full_response = ""
-                    model = get_gemini_model()
-                    if model:
-                        history = []
-                        history.append({"role": "user", "parts": [f"Here is the paper I am asking about:\n\nTitle: {paper['title']}\n\nFull Text (truncated to 16000 characters):\n{paper['full_text'][:16000]} "]})
-                        for msg in st.session_state.messages:
-                            role = msg["role"]
-                            if role == "assistant":
-                                role = "model"
-                            history.append({"role": role, "parts": [msg["content"]]})
-                        
-                        response = model.generate_content(history, stream=True)
-
-                        for chunk in response:
-                            try:
-                                full_response += chunk.text
-                                placeholder.markdown(full_response + "▌")
-                            except ValueError:
-                                pass
-                        placeholder.markdown(full_response)
-                        st.session_state.messages.append({"role": "model", "content": full_response})
-                    else:
-                        full_response = "Please enter your Gemini API key to use the chat."
-                        placeholder.markdown(full_response)
-                        st.session_state.messages.append({"role": "model", "content": full_response})
+        show_chat_panel(username, paper)
+
+
+def show_answer_grid(titles):
+    """Lays out one answer slot per paper, two per row. Returns a placeholder per title."""
+    placeholders = {}
+    for start in range(0, len(titles), 2):
+        for column, title in zip(st.columns(2), titles[start:start + 2]):
+            with column, st.container(border=True):
+                st.markdown(f"**{title}**")
+                placeholders[title] = st.empty()
+    return placeholders
+
+
+def show_compare_page():
+    if 'username' not in st.session_state:
+        st.session_state.page = 'login'
+        st.rerun()
+        return
+    username = st.session_state.username
 
-                    # Save the updated chat history
-                    safe_title = "".join(c for c in paper['title'] if c.isalnum() or c in (' ', '_')).rstrip()
-                    chat_filename = f"{safe_title}.chat.json"
-                    chat_filepath = os.path.join(SAVED_PAPERS_DIR, username, chat_filename)
-                    with open(chat_filepath, "w") as f:
-                        json.dump(st.session_state.messages, f)
+    # --- Sidebar ---
+    if st.sidebar.button("<- Back to Search", key="compare_back"):
+        st.session_state.page = 'retrieval'
+        st.rerun()
 
-        if prompt := st.chat_input("Ask questions about the paper..."):
-            st.session_state.messages.append({"role": "user", "content": prompt})
-            st.rerun()
+    with st.sidebar:
+        show_library_sidebar(username, "compare")
 
+    st.sidebar.write("---")
+
+    col1, col2 = st.sidebar.columns(2)
+    with col1:
+        st.write(f"Hello, {username}")
+    with col2:
+        if st.button("Logout", key="logout_compare"):
+            log_out()
+    with st.sidebar:
+        show_ingestion_progress(username)
+    if username in config.ADMIN_USERS:
+        show_diagnostics()
+
+    # --- Main Page Content ---
+    st.title("Ask Across Papers")
+    papers = {paper['safe_title']: paper['title'] for paper in paper_store.list_papers(username)}
+    if not papers:
+        st.info("Save some papers first to ask questions across them.")
+        return
+
+    with st.form(key='compare_form'):
+        selected = st.multiselect("Papers", list(papers), format_func=papers.get,
+                                  max_selections=config.MULTI_QA_MAX_PAPERS, key="compare_papers")
+        question = st.text_area("Question", key="compare_question")
+        ask = st.form_submit_button("Ask")
+
+    if ask:
+        if len(selected) < 2 or not question.strip():
+            st.warning("Pick at least two papers and enter a question.")
+            return
+        model = get_gemini_model()
+        if not model:
+            st.error("Please enter your Gemini API key in the .env file.")
+            return
+        titles = [papers[safe_title] for safe_title in selected]
+        placeholders = show_answer_grid(titles)
+        answers = {title: "" for title in titles}
+        failed = {}
+        # Workers only queue text; all drawing happens here on the script thread
+        with metrics.timed("multi_qa"):
+            for safe_title, kind, text in multi_qa.stream_answers(model, username, selected, question):
+                title = papers[safe_title]
+                if kind == multi_qa.CHUNK:
+                    answers[title] += text
+                    placeholders[title].markdown(answers[title] + "▌")
+                elif kind == multi_qa.DONE:
+                    placeholders[title].markdown(answers[title])
+                else:
+                    failed[title] = text
+                    placeholders[title].error(f"Could not answer from this paper: {text}")
+
+            st.subheader("Synthesized Answer")
+            placeholder = st.empty()
+            synthesis = ""
+            answered = {title: answer for title, answer in answers.items() if title not in failed}
+            if answered:
+                stream = multi_qa.synthesize(model, question, answered)
+                for chunk_text in metrics.timed_stream(stream, "multi_qa_synthesis"):
+                    synthesis += chunk_text
+                    placeholder.markdown(synthesis + "▌")
+                placeholder.markdown(synthesis)
+            else:
+                placeholder.info("None of the papers could be answered.")
+        st.session_state.compare_result = {'question': question, 'answers': answers, 'failed': failed, 'synthesis': synthesis}
+
+    elif 'compare_result' in st.session_state:
+        # Show the last answers again on reruns without asking Gemini again
+        result = st.session_state.compare_result
+        st.caption(f"Question: {result['question']}")
+        placeholders = show_answer_grid(list(result['answers']))
+        for title, answer in result['answers'].items():
+            if title in result['failed']:
+                placeholders[title].error(f"Could not answer from this paper: {result['failed'][title]}")
+            else:
+                placeholders[title].markdown(answer)
+        st.subheader("Synthesized Answer")
+        st.markdown(result['synthesis'])
 
 
 # --- App Entry Point ---
 if __name__ == "__main__":
+    metrics.start_sampler()
     if 'page' not in st.session_state:
         st.session_state.page = 'login'
-
-    if st.session_state.page == 'login':
-        show_login_signup()
-    elif st.session_state.page == 'retrieval':
-        show_retrieval_page()
-    elif st.session_state.page == 'chat':
-        show_chat_page()
\ No newline at end of file
+        restore_session()
+
+    # Time each script run per page to see which user actions cause latency spikes
+    with metrics.timed(f"page_{st.session_state.page}"):
+        if st.session_state.page == 'login':
+            show_login_signup()
+        elif st.session_state.page == 'retrieval':
+            show_retrieval_page()
+        elif st.session_state.page == 'chat':
+            show_chat_page()
+        elif st.session_state.page == 'compare':
+            show_compare_page()
+    write_session_cookie()
+    metrics.record_startup(time.perf_counter() - run_started)
\ No newline at end of file
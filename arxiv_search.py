@@ -0,0 +1,71 @@
+import threading
+
+import arxiv
+import pandas as pd
+
+import analytics
+import config
+import metrics
+import search_cache
+
+
+def build_query(search_query, start_date, end_date):
+    """Adds the optional submitted-date range to a search query."""
+    if start_date and end_date:
+        date_query = f'submittedDate:[{start_date.strftime("%Y%m%d")} TO {end_date.strftime("%Y%m%d")}]'
+        return f'({search_query}) AND {date_query}'
+    return search_query
+
+
+class SearchJob:
+    """An arXiv search consumed page by page on a background thread.
+
+    `results` grows as pages arrive and can be rendered while the search is
+    still running. Finished searches are written to the search cache.
+    """
+
+    def __init__(self, cache_key, max_results, results=None):
+        self.cache_key = cache_key
+        self.max_results = max_results
+        self.results = results if results is not None else []
+        self.done = results is not None
+        self.from_cache = results is not None
+        self.error = None
+        self._frame_rows = 0
+        self._frame = None
+        self._lock = threading.Lock()
+
+    def view(self):
+        """Returns the results fetched so far and their analytics frame, flattening only new results."""
+        with self._lock:
+            new_results = self.results[self._frame_rows:]
+            if self._frame is None or new_results:
+                new_frame = analytics.results_frame(new_results)
+                self._frame = new_frame if self._frame is None else pd.concat([self._frame, new_frame], ignore_index=True)
+                self._frame_rows += len(new_results)
+            return list(self.results), self._frame
+
+    def _run(self, search):
+        client = arxiv.Client(page_size=config.SEARCH_PAGE_SIZE)
+        try:
+            for result in metrics.timed_stream(client.results(search), "arxiv_search", "arxiv_search_first_result"):
+                with self._lock:
+                    self.results.append(result)
+            search_cache.cache.put(self.cache_key, list(self.results))
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+
+
+def start_search(search_query, start_date, end_date, max_results, sort_by):
+    """Starts a search, returning a finished job straight away on a cache hit."""
+    cache_key = search_cache.make_key(search_query, start_date, end_date, max_results, sort_by)
+    results = search_cache.cache.get(cache_key)
+    if results is not None:
+        return SearchJob(cache_key, max_results, results)
+
+    job = SearchJob(cache_key, max_results)
+    search = arxiv.Search(query=build_query(search_query, start_date, end_date), max_results=max_results, sort_by=sort_by)
+    threading.Thread(target=job._run, args=(search,), name="arxiv-search", daemon=True).start()
+    return job
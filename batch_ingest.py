@@ -0,0 +1,217 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import config
+import database
+import ingest
+import llm
+import metrics
+import paper_store
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# New-style (2101.00001v2) and old-style (hep-th/9901001) arXiv IDs, bare or as an abs/pdf URL
+ARXIV_ID = re.compile(
+    r"^(?:arxiv:|https?://(?:www\.)?arxiv\.org/(?:abs|pdf)/)?"
+    r"(\d{4}\.\d{4,5}(?:v\d+)?|[a-z\-]+(?:\.[A-Z]{2})?/\d{7}(?:v\d+)?)(?:\.pdf)?$",
+    re.IGNORECASE,
+)
+REPORT_STAGES = ('arxiv_resolve', 'pdf_download', 'pdf_extract', 'gemini_call', 'index_build', 'library_write', 'batch_paper')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Saves papers into a user's library without the web UI. Each line of the input file is an "
+                    "arXiv ID or URL, or a search query whose top results are saved. Blank lines and lines "
+                    "starting with # are ignored. Progress is checkpointed, so rerunning the same command "
+                    "resumes an interrupted run.")
+    parser.add_argument("input", help="file of arXiv IDs and search queries, one per line")
+    parser.add_argument("--user", required=True, help="username whose library the papers are saved to")
+    parser.add_argument("--workers", type=int, default=config.BATCH_INGEST_WORKERS, help="papers ingested at once")
+    parser.add_argument("--per-query", type=int, default=config.BATCH_RESULTS_PER_QUERY,
+                        help="papers saved per search query")
+    parser.add_argument("--checkpoint", help="checkpoint database (default: <input>.<user>.checkpoint.db)")
+    return parser.parse_args()
+
+
+# --- Checkpoint ---
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS sources (line TEXT PRIMARY KEY)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS papers (
+            entry_id TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            paper TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            seconds REAL
+        )
+    """)
+    return conn
+
+
+def _record(conn, line, papers):
+    """Checkpoints the papers an input line resolved to, so resumed runs don't search again."""
+    with conn:
+        position = conn.execute("SELECT COALESCE(MAX(position), 0) FROM papers").fetchone()[0]
+        for paper in papers:
+            position += 1
+            conn.execute("INSERT OR IGNORE INTO papers (entry_id, position, paper, status) VALUES (?, ?, ?, ?)",
+                         (paper['entry_id'], position, json.dumps(paper), PENDING))
+        conn.execute("INSERT INTO sources (line) VALUES (?)", (line,))
+
+
+def _finish(conn, entry_id, status, error=None, seconds=None):
+    with conn:
+        conn.execute("UPDATE papers SET status = ?, attempts = attempts + 1, error = ?, seconds = ? WHERE entry_id = ?",
+                     (status, error, seconds, entry_id))
+
+
+# --- Resolving IDs and queries ---
+def read_lines(path):
+    """Returns the input file's non-empty, non-comment lines in order, without duplicates."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+def _fetch(search):
+    import arxiv
+
+    client = arxiv.Client(page_size=config.SEARCH_PAGE_SIZE)
+    with metrics.timed("arxiv_resolve"):
+        return [ingest.paper_from_result(result) for result in client.results(search)]
+
+
+def _short_ids(entry_id):
+    short_id = entry_id.split("/abs/")[-1]
+    return {short_id, re.sub(r"v\d+$", "", short_id)}
+
+
+def resolve(conn, lines, per_query):
+    """Looks up every input line not yet in the checkpoint. IDs are fetched in batches."""
+    import arxiv
+
+    done = {row[0] for row in conn.execute("SELECT line FROM sources")}
+    lines = [line for line in lines if line not in done]
+    ids = [(line, ARXIV_ID.match(line).group(1)) for line in lines if ARXIV_ID.match(line)]
+    queries = [line for line in lines if not ARXIV_ID.match(line)]
+
+    for start in range(0, len(ids), config.SEARCH_PAGE_SIZE):
+        batch = ids[start:start + config.SEARCH_PAGE_SIZE]
+        papers = _fetch(arxiv.Search(id_list=[arxiv_id for _, arxiv_id in batch]))
+        for line, arxiv_id in batch:
+            # Entry IDs are URLs with a version suffix, which the input may leave out
+            found = [paper for paper in papers if arxiv_id in _short_ids(paper['entry_id'])][:1]
+            if not found:
+                print(f"No arXiv paper found for '{line}'")
+            _record(conn, line, found)
+
+    for line in queries:
+        papers = _fetch(arxiv.Search(query=line, max_results=per_query, sort_by=arxiv.SortCriterion.Relevance))
+        print(f"'{line}': {len(papers)} papers")
+        _record(conn, line, papers)
+
+
+# --- Ingestion ---
+def _ingest(model, paper, username):
+    with metrics.timed("batch_paper"):
+        ingest.save_paper(model, paper, username)
+
+
+def ingest_pending(conn, model, username, workers):
+    """Saves every checkpointed paper that isn't done yet. Returns the counts per outcome."""
+    rows = conn.execute("SELECT entry_id, paper FROM papers WHERE status != ? ORDER BY position", (DONE,)).fetchall()
+    counts = {'saved': 0, 'already_saved': 0, 'failed': 0}
+    saved_titles = paper_store.saved_titles(username)
+    todo = []
+    for entry_id, paper_json in rows:
+        paper = json.loads(paper_json)
+        if ingest.safe_filename(paper['title']) in saved_titles:
+            _finish(conn, entry_id, DONE)
+            counts['already_saved'] += 1
+        else:
+            todo.append((entry_id, paper))
+
+    total = len(todo)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-ingest")
+    running = {}
+    try:
+        while todo or running:
+            while todo and len(running) < workers:
+                entry_id, paper = todo.pop(0)
+                running[executor.submit(_ingest, model, paper, username)] = (entry_id, paper, time.perf_counter())
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry_id, paper, started = running.pop(future)
+                seconds = time.perf_counter() - started
+                finished = counts['saved'] + counts['failed'] + 1
+                try:
+                    future.result()
+                except Exception as e:
+                    _finish(conn, entry_id, FAILED, str(e), seconds)
+                    counts['failed'] += 1
+                    print(f"[{finished}/{total}] failed  {paper['title']}: {e}")
+                else:
+                    _finish(conn, entry_id, DONE, seconds=seconds)
+                    counts['saved'] += 1
+                    print(f"[{finished}/{total}] saved   {paper['title']} ({seconds:.1f}s)")
+    finally:
+        # On Ctrl-C, unstarted papers stay pending in the checkpoint; running ones are left to finish
+        executor.shutdown(wait=False, cancel_futures=True)
+    return counts
+
+
+def print_report(counts, elapsed):
+    print()
+    print(f"Saved {counts['saved']}, already saved {counts['already_saved']}, failed {counts['failed']} "
+          f"in {elapsed:.1f}s ({counts['saved'] / elapsed * 60 if elapsed else 0:.1f} papers/min)")
+    stats = metrics.stage_stats()
+    print(f"{'stage':<16}{'count':>8}{'errors':>8}{'mean_s':>10}{'p95_s':>10}{'per_min':>10}")
+    for stage in REPORT_STAGES:
+        if stage in stats:
+            s = stats[stage]
+            print(f"{stage:<16}{s['count']:>8}{s['errors']:>8}{s['mean']:>10.2f}{s['p95']:>10.2f}"
+                  f"{s['count'] / elapsed * 60 if elapsed else 0:>10.1f}")
+
+
+def main():
+    args = parse_args()
+    # Accounts and library folders are keyed by the lowercased name, as in the app
+    username = args.user.lower()
+    if not database.user_exists(username):
+        sys.exit(f"No account named '{args.user}'. Sign up in the app first.")
+    model = llm.get_model()
+    if model is None:
+        sys.exit("GEMINI_API_KEY is not set.")
+
+    checkpoint = args.checkpoint or f"{args.input}.{username}.checkpoint.db"
+    started = time.perf_counter()
+    with closing(_connect(checkpoint)) as conn:
+        os.makedirs(paper_store.user_folder(username), exist_ok=True)
+        paper_store.migrate_txt_library(username)
+        try:
+            resolve(conn, read_lines(args.input), args.per_query)
+            counts = ingest_pending(conn, model, username, args.workers)
+        except KeyboardInterrupt:
+            sys.exit(f"\nInterrupted. Rerun the same command to resume from {checkpoint}.")
+        print_report(counts, time.perf_counter() - started)
+    if counts['failed']:
+        print(f"Rerun the same command to retry the failed papers (errors are kept in {checkpoint}).")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import json
+import time
+import random
+import threading
+import zlib
+from xml.sax.saxutils import escape
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = (
+    "model training data neural network attention transformer quantum state graph node "
+    "learning gradient loss optimization benchmark evaluation dataset layer embedding "
+    "inference sampling probability theorem proof algorithm complexity bound error"
+).split()
+CATEGORIES = ["cs.LG", "cs.AI", "cs.CL", "quant-ph", "stat.ML", "cs.CV"]
+
+
+# --- Generated PDFs ---
+def make_pdf(pages, lines_per_page=40, seed=0):
+    """Builds a text-only PDF with `pages` pages of generated prose."""
+    rnd = random.Random(seed)
+    page_ids = [4 + 2 * i for i in range(pages)]
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: f"<< /Type /Pages /Kids [{' '.join(f'{pid} 0 R' for pid in page_ids)}] /Count {pages} >>".encode(),
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    for pid in page_ids:
+        lines = [" ".join(rnd.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        text = " T* ".join(f"({line}) Tj" for line in lines)
+        stream = zlib.compress(f"BT /F1 10 Tf 14 TL 40 800 Td {text} ET".encode())
+        objects[pid] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                        f"/Resources << /Font << /F1 3 0 R >> >> /Contents {pid + 1} 0 R >>").encode()
+        objects[pid + 1] = f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode() + stream + b"\nendstream"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for oid in sorted(objects):
+        offsets[oid] = len(out)
+        out += f"{oid} 0 obj\n".encode() + objects[oid] + b"\nendobj\n"
+    xref = len(out)
+    size = max(objects) + 1
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode()
+    for oid in range(1, size):
+        out += f"{offsets[oid]:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def page_count(paper_id, min_pages, max_pages):
+    """Deterministic page count of a fake paper, so runs are comparable."""
+    return random.Random(paper_id).randint(min_pages, max_pages)
+
+
+# --- Fake arXiv API and PDF host ---
+def _entry(base_url, n):
+    rnd = random.Random(n)
+    title = " ".join(rnd.choice(WORDS) for _ in range(6)).title() + f" {n}"
+    authors = "".join(f"<author><name>Author {rnd.randint(0, 200)}</name></author>" for _ in range(rnd.randint(1, 5)))
+    summary = " ".join(rnd.choice(WORDS) for _ in range(150))
+    category = rnd.choice(CATEGORIES)
+    date = f"{rnd.randint(2005, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T00:00:00Z"
+    return (
+        f"<entry><id>http://arxiv.org/abs/{n:07d}v1</id><updated>{date}</updated><published>{date}</published>"
+        f"<title>{escape(title)}</title><summary>{summary}</summary>{authors}"
+        f"<link href=\"http://arxiv.org/abs/{n:07d}v1\" rel=\"alternate\" type=\"text/html\"/>"
+        f"<link title=\"pdf\" href=\"{base_url}/pdf/{n}\" rel=\"related\" type=\"application/pdf\"/>"
+        f"<arxiv:primary_category term=\"{category}\"/><category term=\"{category}\"/></entry>"
+    )
+
+
+class FakeServer:
+    """Serves an arXiv-like Atom query API and generated PDFs from a local thread.
+
+    `/api/query` pages through `total_results` deterministic papers, and
+    `/pdf/<n>` returns paper n as a PDF of `min_pages` to `max_pages` pages.
+    `latency` seconds are added to every response.
+    """
+
+    def __init__(self, total_results=10000, min_pages=4, max_pages=40, latency=0.0):
+        self.total_results = total_results
+        self.min_pages = min_pages
+        self.max_pages = max_pages
+        self.latency = latency
+        self._pdfs = {}
+        self._pdfs_lock = threading.Lock()
+        self.requests = {'query': 0, 'pdf': 0}
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, name="fake-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def pdf(self, n):
+        with self._pdfs_lock:
+            if n not in self._pdfs:
+                self._pdfs[n] = make_pdf(page_count(n, self.min_pages, self.max_pages), seed=n)
+            return self._pdfs[n]
+
+    def feed(self, start, max_results):
+        entries = "".join(_entry(self.base_url, n) for n in range(start, min(start + max_results, self.total_results)))
+        return (
+            "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+            "<feed xmlns=\"http://www.w3.org/2005/Atom\" xmlns:arxiv=\"http://arxiv.org/schemas/atom\" "
+            "xmlns:opensearch=\"http://a9.com/-/spec/opensearch/1.1/\">"
+            f"<opensearch:totalResults>{self.total_results}</opensearch:totalResults>"
+            f"<opensearch:startIndex>{start}</opensearch:startIndex>"
+            f"<opensearch:itemsPerPage>{max_results}</opensearch:itemsPerPage>"
+            f"{entries}</feed>"
+        ).encode("utf-8")
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(server.latency)
+                url = urlparse(self.path)
+                if url.path == "/api/query":
+                    server.requests['query'] += 1
+                    args = parse_qs(url.query)
+                    body = server.feed(int(args.get("start", ["0"])[0]), int(args.get("max_results", ["10"])[0]))
+                    self._send(body, "application/atom+xml")
+                elif url.path.startswith("/pdf/"):
+                    server.requests['pdf'] += 1
+                    self._send(server.pdf(int(url.path.rsplit("/", 1)[1])), "application/pdf")
+                else:
+                    self.send_error(404)
+
+            def _send(self, body, content_type):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+# --- Fake Gemini ---
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for `genai.GenerativeModel` with a fixed latency and chunked streaming.
+
+    Every call waits `latency` seconds before answering; streamed answers are
+    split into `chunk_chars`-sized chunks with `chunk_delay` seconds between them.
+    """
+
+    model_name = "fake-gemini"
+
+    def __init__(self, latency=0.2, chunk_chars=40, chunk_delay=0.01, reply_chars=800):
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.reply_chars = reply_chars
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _reply(self, contents):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        rnd = random.Random(n)
+        text = " ".join(rnd.choice(WORDS) for _ in range(self.reply_chars // 6))[:self.reply_chars]
+        prompt = contents if isinstance(contents, str) else ""
+        if "JSON object" in prompt:
+            return json.dumps({'summary': text, 'drawbacks': text[::-1]})
+        return text
+
+    def _stream(self, text):
+        for i in range(0, len(text), self.chunk_chars):
+            time.sleep(self.chunk_delay)
+            yield _Chunk(text[i:i + self.chunk_chars])
+
+    def generate_content(self, contents, stream=False, **params):
+        time.sleep(self.latency)
+        text = self._reply(contents)
+        return self._stream(text) if stream else _Chunk(text)
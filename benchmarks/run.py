@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+import psutil
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLOWS = ['startup', 'search', 'save', 'open', 'chat']
+USERNAME = 'bench'
+
+# Run in a fresh interpreter: renders the login page once, like a new server's first request
+STARTUP_SCRIPT = """
+import sys
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+sys.exit(1 if at.exception else 0)
+"""
+
+# Storage settings pointed into the scratch directory so runs never touch real data
+STORAGE_SETTINGS = {
+    'SAVED_PAPERS_DIR': "saved_papers",
+    'CACHE_DIR': ".cache",
+    'BLOB_STORE_DIR': "paper_blobs",
+    'USERS_DB': "users.db",
+    'INGEST_QUEUE_DB': "ingest_queue.db",
+    'PDF_CACHE_DIR': os.path.join(".cache", "pdfs"),
+    'PAGE_CACHE_DB': os.path.join(".cache", "page_text.db"),
+    'LLM_CACHE_DB': os.path.join(".cache", "llm_cache.db"),
+    'SESSION_SECRET_FILE': os.path.join(".cache", "session_secret"),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the search, save, library-open and chat flows of app.py headlessly "
+                    "against local stand-ins for arXiv, Gemini and PDF hosting.")
+    parser.add_argument("--flows", default=",".join(FLOWS), help="comma-separated flows to run (default: all)")
+    parser.add_argument("--iterations", type=int, default=5, help="measured iterations per flow")
+    parser.add_argument("--results", type=int, default=100, help="papers fetched per search")
+    parser.add_argument("--gemini-latency", type=float, default=0.2, help="seconds before each Gemini reply")
+    parser.add_argument("--chunk-chars", type=int, default=40, help="characters per streamed Gemini chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="seconds between streamed chunks")
+    parser.add_argument("--min-pages", type=int, default=4, help="fewest pages in a generated PDF")
+    parser.add_argument("--max-pages", type=int, default=40, help="most pages in a generated PDF")
+    parser.add_argument("--server-latency", type=float, default=0.0, help="seconds added to each arXiv/PDF response")
+    parser.add_argument("--arxiv-delay", type=float, default=0.0, help="seconds the arXiv client waits between pages")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="print deltas against a previous JSON output")
+    parser.add_argument("--keep-workdir", action="store_true", help="keep the scratch directory after the run")
+    return parser.parse_args()
+
+
+# --- Measurement ---
+class PeakRSS:
+    """Samples the process's resident set size on a thread and keeps the peak."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(sorted_values, q):
+    """Linearly interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies, errors, elapsed, peak_rss):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        'count': len(values),
+        'errors': errors,
+        'p50_ms': ms(percentile(values, 50)),
+        'p90_ms': ms(percentile(values, 90)),
+        'p99_ms': ms(percentile(values, 99)),
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'max_ms': ms(values[-1]) if values else None,
+        'throughput_per_s': round(len(values) / elapsed, 3) if elapsed else None,
+        'peak_rss_mb': round(peak_rss / 2 ** 20, 1),
+    }
+
+
+class FlowRunner:
+    """Drives one AppTest session through the app's flows, timing each step."""
+
+    def __init__(self, at, args):
+        self.at = at
+        self.args = args
+        self.error_messages = {}
+
+    def _step(self, flow, action):
+        start = time.perf_counter()
+        action()
+        latency = time.perf_counter() - start
+        failed = bool(self.at.exception)
+        if failed:
+            self.error_messages.setdefault(flow, self.at.exception[0].message)
+        return latency, failed
+
+    def measure(self, flow, steps):
+        latencies, errors = [], 0
+        with PeakRSS() as rss:
+            start = time.perf_counter()
+            for action in steps:
+                latency, failed = self._step(flow, action)
+                latencies.append(latency)
+                errors += failed
+            elapsed = time.perf_counter() - start
+        return summarize(latencies, errors, elapsed, rss.peak)
+
+    def to_retrieval_page(self):
+        if self.at.session_state['page'] != 'retrieval':
+            self.at.sidebar.button[0].click().run()  # "<- Back to Search"
+
+    def search(self, query):
+        at = self.at
+        next(w for w in at.text_input if w.label == "Search for papers").input(query)
+        next(w for w in at.number_input if w.label == "Number of papers").set_value(self.args.results)
+        next(b for b in at.button if b.label == "Search").click().run()
+        job = at.session_state['search_job']
+        while not job.done:
+            time.sleep(0.005)
+        at.run()
+
+    def save(self, index):
+        result = self.at.session_state['search_results'][index]
+        self.at.button(key=f"save_{result.entry_id}_{index}").click().run()
+
+    def open(self, safe_title):
+        self.to_retrieval_page()
+        self.at.sidebar.button(key=f"sidebar_retrieval_{safe_title}").click().run()
+
+    def chat(self, question):
+        self.at.chat_input[0].set_value(question).run()
+
+
+def measure_startup(iterations):
+    """Times cold starts: a fresh interpreter importing app.py and rendering the login page."""
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        launched = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, os.path.join(REPO_DIR, "app.py")],
+                                   capture_output=True)
+        latencies.append(time.perf_counter() - launched)
+        errors += completed.returncode != 0
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return summarize(latencies, errors, elapsed, peak_rss)
+
+
+def run_flows(args, flows):
+    import config
+    import database
+    import llm
+    import metrics
+    import paper_store
+    import arxiv
+    from streamlit.testing.v1 import AppTest
+    from benchmarks.fakes import FakeServer, FakeModel
+
+    server = FakeServer(min_pages=args.min_pages, max_pages=args.max_pages, latency=args.server_latency).start()
+    model = FakeModel(latency=args.gemini_latency, chunk_chars=args.chunk_chars, chunk_delay=args.chunk_delay)
+
+    class LocalClient(arxiv.Client):
+        query_url_format = f"{server.base_url}/api/query?{{}}"
+
+        def __init__(self, page_size=100, delay_seconds=args.arxiv_delay, num_retries=3):
+            super().__init__(page_size=page_size, delay_seconds=delay_seconds, num_retries=num_retries)
+
+    arxiv.Client = LocalClient
+    llm.get_model = lambda: model
+    database.add_user(USERNAME, "benchmark")
+
+    at = AppTest.from_file(os.path.join(REPO_DIR, "app.py"), default_timeout=600)
+    at.session_state['username'] = USERNAME
+    at.session_state['page'] = 'retrieval'
+    at.run()  # Warm up imports and module-level caches outside the measurements
+    runner = FlowRunner(at, args)
+
+    iterations = args.iterations
+    saves = min(iterations, config.RESULTS_PAGE_SIZE, args.results)
+    report = {}
+    if 'search' in flows:
+        report['search'] = runner.measure('search', [lambda i=i: runner.search(f"benchmark query {i}") for i in range(iterations)])
+    if {'save', 'open', 'chat'} & set(flows):
+        runner.to_retrieval_page()
+        runner.search("benchmark papers to save")
+        steps = [lambda i=i: runner.save(i) for i in range(saves)]
+        if 'save' in flows:
+            report['save'] = runner.measure('save', steps)
+        else:
+            for step in steps:
+                step()
+    titles = [paper['safe_title'] for paper in paper_store.list_papers(USERNAME)]
+    if 'open' in flows and titles:
+        report['open'] = runner.measure('open', [lambda i=i: runner.open(titles[i % len(titles)]) for i in range(iterations)])
+    if 'chat' in flows and titles:
+        runner.open(titles[0])
+        report['chat'] = runner.measure('chat', [lambda i=i: runner.chat(f"Question {i}: what are the main results?") for i in range(iterations)])
+
+    for flow, message in runner.error_messages.items():
+        report[flow]['first_error'] = message
+    counters = {'gemini_calls': model.calls, 'arxiv_requests': server.requests['query'], 'pdf_requests': server.requests['pdf'],
+                'stages': metrics.stage_stats()}
+    server.stop()
+    return report, counters
+
+
+# --- Reporting ---
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    columns = ['count', 'errors', 'p50_ms', 'p90_ms', 'p99_ms', 'mean_ms', 'throughput_per_s', 'peak_rss_mb']
+    print(f"{'flow':<8}" + "".join(f"{column:>18}" for column in columns))
+    for flow, stats in report.items():
+        cells = []
+        for column in columns:
+            value = stats[column]
+            cell = "-" if value is None else f"{value}"
+            previous = (baseline or {}).get(flow, {}).get(column)
+            if previous and value is not None and column not in ('count', 'errors'):
+                cell += f" ({(value - previous) / previous:+.0%})"
+            cells.append(f"{cell:>18}")
+        print(f"{flow:<8}" + "".join(cells))
+        if 'first_error' in stats:
+            print(f"         first error: {stats['first_error']}")
+
+
+def main():
+    args = parse_args()
+    flows = [flow.strip() for flow in args.flows.split(",") if flow.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        sys.exit(f"Unknown flows: {', '.join(sorted(unknown))}")
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['flows']
+
+    workdir = tempfile.mkdtemp(prefix="paper-bench-")
+    os.chdir(workdir)
+    for name, path in STORAGE_SETTINGS.items():
+        os.environ[name] = os.path.join(workdir, path)
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    sys.path.insert(0, REPO_DIR)
+
+    started = time.time()
+    startup = measure_startup(args.iterations) if 'startup' in flows else None
+    report, counters = run_flows(args, flows)
+    if startup:
+        report = {'startup': startup, **report}
+    result = {
+        'meta': {
+            'started': started,
+            'duration_s': round(time.time() - started, 2),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'params': vars(args),
+            **counters,
+        },
+        'flows': report,
+    }
+
+    print_report(report, baseline)
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.keep_workdir:
+        print(f"Scratch directory: {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
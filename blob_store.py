@@ -0,0 +1,227 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing
+
+import config
+import text_blocks
+
+PDF = 'pdf'
+TEXT = 'text'
+
+_EXTENSIONS = {PDF: '.pdf', TEXT: '.ztxt'}
+_write_lock = threading.Lock()
+
+
+def _connect():
+    os.makedirs(config.BLOB_STORE_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(config.BLOB_STORE_DIR, "blobs.db"), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            touched REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS entries (
+            entry_id TEXT PRIMARY KEY,
+            pdf_sha256 TEXT NOT NULL,
+            text_sha256 TEXT NOT NULL
+        )
+    """)
+    return conn
+
+
+def path(kind, sha256):
+    """Returns the file path of a stored PDF or text blob."""
+    return os.path.join(config.BLOB_STORE_DIR, kind, sha256[:2], f"{sha256}{_EXTENSIONS[kind]}")
+
+
+def _legacy_text_path(sha256):
+    # Text blobs were plain UTF-8 before block compression
+    return os.path.join(config.BLOB_STORE_DIR, TEXT, sha256[:2], f"{sha256}.txt")
+
+
+def _has_text(sha256):
+    return os.path.exists(path(TEXT, sha256)) or os.path.exists(_legacy_text_path(sha256))
+
+
+def index_path(text_sha256):
+    """Returns the retrieval index path for a stored text blob."""
+    return os.path.join(config.BLOB_STORE_DIR, "index", text_sha256[:2], f"{text_sha256}.index.npz")
+
+
+def _register(sha256, kind):
+    with closing(_connect()) as conn, conn:
+        conn.execute("""
+            INSERT INTO blobs (sha256, kind, touched) VALUES (?, ?, ?)
+            ON CONFLICT (sha256) DO UPDATE SET touched = excluded.touched
+        """, (sha256, kind, time.time()))
+
+
+def put_pdf(src_path):
+    """Adds a PDF to the store, hard-linking it when possible. Returns its content hash."""
+    h = hashlib.sha256()
+    with open(src_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    sha256 = h.hexdigest()
+    dest = path(PDF, sha256)
+    with _write_lock:
+        if not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp_path = f"{dest}.tmp"
+            try:
+                os.link(src_path, tmp_path)
+            except OSError:
+                shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, dest)
+        _register(sha256, PDF)
+    return sha256
+
+
+def _write_text(sha256, text):
+    dest = path(TEXT, sha256)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp_path = f"{dest}.{threading.get_ident()}.tmp"
+    text_blocks.write(tmp_path, text)
+    os.replace(tmp_path, dest)
+
+
+def put_text(text):
+    """Adds extracted text to the store, block-compressed. Returns the hash of its UTF-8 encoding."""
+    sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _write_lock:
+        if not os.path.exists(path(TEXT, sha256)):
+            _write_text(sha256, text)
+        if os.path.exists(_legacy_text_path(sha256)):
+            os.remove(_legacy_text_path(sha256))
+        _register(sha256, TEXT)
+    return sha256
+
+
+def _upgrade_text(sha256):
+    with _write_lock:
+        legacy = _legacy_text_path(sha256)
+        if not os.path.exists(legacy):
+            return False
+        if not os.path.exists(path(TEXT, sha256)):
+            with open(legacy, "r", encoding="utf-8") as f:
+                _write_text(sha256, f.read())
+        os.remove(legacy)
+        return True
+
+
+def open_text(sha256):
+    """Returns the shared reader of a stored text blob, for reading character ranges without loading it all.
+
+    Text stored before block compression is compressed on first use.
+    """
+    if not os.path.exists(path(TEXT, sha256)):
+        _upgrade_text(sha256)
+    return text_blocks.open_reader(path(TEXT, sha256))
+
+
+def read_text(sha256):
+    """Reads a whole stored text blob."""
+    return open_text(sha256).read()
+
+
+def upgrade_texts():
+    """Block-compresses all text blobs still stored as plain UTF-8. Returns the number converted."""
+    with closing(_connect()) as conn:
+        hashes = [row[0] for row in conn.execute("SELECT sha256 FROM blobs WHERE kind = ?", (TEXT,))]
+    return sum(_upgrade_text(sha256) for sha256 in hashes)
+
+
+def record_entry(entry_id, pdf_sha256, text_sha256):
+    """Remembers which PDF and text blobs an arXiv entry resolved to."""
+    with closing(_connect()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO entries (entry_id, pdf_sha256, text_sha256) VALUES (?, ?, ?)",
+                     (entry_id, pdf_sha256, text_sha256))
+
+
+def lookup_entry(entry_id):
+    """Returns the stored PDF and text hashes of an arXiv entry, or None if it isn't stored."""
+    if not entry_id:
+        return None
+    with closing(_connect()) as conn, conn:
+        row = conn.execute("SELECT pdf_sha256, text_sha256 FROM entries WHERE entry_id = ?", (entry_id,)).fetchone()
+        if row is None or not (os.path.exists(path(PDF, row[0])) and _has_text(row[1])):
+            return None
+        # Touch the blobs so a collection running before they are referenced spares them
+        conn.executemany("UPDATE blobs SET touched = ? WHERE sha256 = ?", [(time.time(), sha) for sha in row])
+    return {'pdf_sha256': row[0], 'text_sha256': row[1]}
+
+
+def acquire(hashes):
+    """Adds a reference to each stored blob, e.g. from a library entry."""
+    hashes = [sha for sha in hashes if sha]
+    with closing(_connect()) as conn, conn:
+        conn.executemany("UPDATE blobs SET refcount = refcount + 1, touched = ? WHERE sha256 = ?",
+                         [(time.time(), sha) for sha in hashes])
+
+
+def release(hashes):
+    """Drops a reference to each blob. Unreferenced blobs are removed by `collect`."""
+    hashes = [sha for sha in hashes if sha]
+    with closing(_connect()) as conn, conn:
+        conn.executemany("UPDATE blobs SET refcount = MAX(refcount - 1, 0), touched = ? WHERE sha256 = ?",
+                         [(time.time(), sha) for sha in hashes])
+
+
+def collect(grace=None):
+    """Deletes blobs that have been unreferenced for longer than `grace` seconds. Returns the number deleted.
+
+    The grace period keeps blobs alive between being stored by an ingest and
+    being referenced by the library entry it saves. Deleted PDFs are also
+    evicted from the fetch cache and the static folder, which link the same files.
+    """
+    import pdf_fetcher
+    import pdf_serving
+
+    grace = config.BLOB_GC_GRACE if grace is None else grace
+    with _write_lock, closing(_connect()) as conn, conn:
+        rows = conn.execute("SELECT sha256, kind FROM blobs WHERE refcount = 0 AND touched < ?",
+                            (time.time() - grace,)).fetchall()
+        for sha256, kind in rows:
+            paths = [path(kind, sha256)] + ([_legacy_text_path(sha256), index_path(sha256)] if kind == TEXT else [])
+            for blob_path in paths:
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+        conn.executemany("DELETE FROM blobs WHERE sha256 = ?", [(sha256,) for sha256, _ in rows])
+        conn.execute("""
+            DELETE FROM entries
+            WHERE pdf_sha256 NOT IN (SELECT sha256 FROM blobs) OR text_sha256 NOT IN (SELECT sha256 FROM blobs)
+        """)
+    pdf_hashes = [sha256 for sha256, kind in rows if kind == PDF]
+    pdf_fetcher.evict(pdf_hashes)
+    pdf_serving.unpublish(pdf_hashes)
+    return len(rows)
+
+
+def stats():
+    """Returns the number and total size of stored blobs per kind."""
+    with closing(_connect()) as conn:
+        rows = conn.execute("SELECT sha256, kind FROM blobs").fetchall()
+    totals = {kind: {'count': 0, 'bytes': 0} for kind in _EXTENSIONS}
+    for sha256, kind in rows:
+        blob_path = path(kind, sha256)
+        if kind == TEXT and not os.path.exists(blob_path):
+            blob_path = _legacy_text_path(sha256)
+        if os.path.exists(blob_path):
+            totals[kind]['count'] += 1
+            totals[kind]['bytes'] += os.path.getsize(blob_path)
+    return totals
+
+
+if __name__ == "__main__":
+    print(f"Removed {collect()} unreferenced blobs")
+    print(f"Compressed {upgrade_texts()} plain text blobs")
+    print(stats())
@@ -0,0 +1,66 @@
+import config
+import llm
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Roughly estimates the token count of a piece of text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def new_summary_state():
+    """Returns an empty rolling summary: nothing summarized yet."""
+    return {'covered': 0, 'summary': ""}
+
+
+def window_start(messages, budget=config.CHAT_HISTORY_TOKENS):
+    """Returns the index of the oldest message that fits the token budget, counting back from the newest.
+
+    The newest message is always kept, even if it alone exceeds the budget.
+    """
+    used = 0
+    start = len(messages)
+    while start > 0:
+        cost = estimate_tokens(messages[start - 1]["content"])
+        if used + cost > budget and start < len(messages):
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+def _summarize(model, summary, messages):
+    transcript = "\n\n".join(f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages)
+    prompt = (
+        "You maintain a running summary of a conversation about a research paper. "
+        "Update the summary with the new messages below, keeping the questions asked, "
+        "the key facts from the answers and any conclusions. Keep it under "
+        f"{config.CHAT_SUMMARY_TOKENS * CHARS_PER_TOKEN} characters.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"
+    )
+    return llm.generate(model, prompt)
+
+
+def window_history(model, messages, state, budget=config.CHAT_HISTORY_TOKENS):
+    """Splits a conversation into a rolling summary and the recent messages kept verbatim.
+
+    `state` is updated in place. Only messages that left the window since the
+    last call are folded into the summary, and the window is then cut to half
+    the budget so summarization runs only every few turns. Returns (summary, recent_messages).
+    """
+    start = window_start(messages, budget)
+    if state['covered'] > len(messages):
+        state.update(new_summary_state())
+    if start > state['covered']:
+        # Fold down to half the budget so the next few turns need no summarization
+        start = window_start(messages, budget // 2)
+        try:
+            state['summary'] = _summarize(model, state['summary'], messages[state['covered']:start])
+            state['covered'] = start
+        except Exception as e:
+            print(f"Could not update chat summary: {e}")
+            start = state['covered']
+    else:
+        start = state['covered']
+    return state['summary'], messages[start:]
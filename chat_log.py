@@ -0,0 +1,150 @@
+import os
+import json
+import threading
+from array import array
+
+_OFFSET_TYPE = 'Q'
+_OFFSET_SIZE = array(_OFFSET_TYPE).itemsize
+_append_lock = threading.Lock()
+
+
+def index_path(log_path):
+    """Returns the offset index path of a chat log."""
+    return f"{log_path}.idx"
+
+
+def append(log_path, message):
+    """Appends one message to a chat log as a single durable write."""
+    line = (json.dumps(message) + "\n").encode("utf-8")
+    with _append_lock:
+        # A crash between the log write and the index append leaves the index a message short.
+        # Check it before appending: once an offset lands after the gap, reads can no longer notice it
+        _read_offsets(log_path)
+        fd = os.open(log_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                # Terminate a torn write left by a crash so it can't swallow this message
+                line = b"\n" + line
+            os.write(fd, line)
+            os.fsync(fd)
+            end = os.lseek(fd, 0, os.SEEK_CUR)
+        finally:
+            os.close(fd)
+        with open(index_path(log_path), "ab") as f:
+            array(_OFFSET_TYPE, [end - len(line.lstrip(b"\n"))]).tofile(f)
+
+
+def _read_offsets(log_path):
+    """Returns the message offsets, rebuilding the index if it is missing or out of step with the log."""
+    if not os.path.exists(log_path):
+        return array(_OFFSET_TYPE)
+    size = os.path.getsize(log_path)
+    offsets = array(_OFFSET_TYPE)
+    idx_path = index_path(log_path)
+    if os.path.exists(idx_path):
+        with open(idx_path, "rb") as f:
+            data = f.read()
+        offsets.frombytes(data[:len(data) - len(data) % _OFFSET_SIZE])
+    if offsets and offsets[-1] < size and _index_is_current(log_path, offsets[-1]):
+        return offsets
+    if not offsets and size == 0:
+        return offsets
+    return _rebuild_index(log_path)
+
+
+def _index_is_current(log_path, last_offset):
+    """Checks that the last indexed offset starts the log's final complete line."""
+    with open(log_path, "rb") as f:
+        f.seek(max(0, last_offset - 1))
+        tail = f.read()
+    if last_offset:
+        if not tail.startswith(b"\n"):
+            return False
+        tail = tail[1:]
+    return tail.count(b"\n") == 1
+
+
+def _is_message(line):
+    try:
+        json.loads(line)
+        return True
+    except ValueError:
+        return False
+
+
+def _rebuild_index(log_path):
+    offsets = array(_OFFSET_TYPE)
+    position = 0
+    with open(log_path, "rb") as f:
+        for line in f:
+            if line.endswith(b"\n") and _is_message(line):
+                offsets.append(position)
+            position += len(line)
+    tmp_path = f"{index_path(log_path)}.tmp"
+    with open(tmp_path, "wb") as f:
+        offsets.tofile(f)
+    os.replace(tmp_path, index_path(log_path))
+    return offsets
+
+
+def count(log_path):
+    """Returns the number of messages in a chat log."""
+    return len(_read_offsets(log_path))
+
+
+def read_range(log_path, start, stop):
+    """Reads messages [start, stop) from a chat log without parsing the rest of it."""
+    offsets = _read_offsets(log_path)
+    start = max(0, start)
+    stop = min(stop, len(offsets))
+    if start >= stop:
+        return []
+    with open(log_path, "rb") as f:
+        f.seek(offsets[start])
+        end = offsets[stop] if stop < len(offsets) else None
+        data = f.read(end - offsets[start]) if end is not None else f.read()
+    messages = []
+    for line in data.splitlines(keepends=True):
+        # A torn trailing write has no newline and is dropped
+        if line.endswith(b"\n"):
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                continue
+    return messages[:stop - start]
+
+
+def read_tail(log_path, n):
+    """Reads the last `n` messages of a chat log. Returns (first_index, messages)."""
+    total = count(log_path)
+    start = max(0, total - n)
+    return start, read_range(log_path, start, total)
+
+
+def clear(log_path):
+    """Deletes a chat log and its index."""
+    for path in (log_path, index_path(log_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def migrate_json(json_path, log_path):
+    """Converts a legacy whole-file `.chat.json` history into an append-only log."""
+    if not os.path.exists(json_path):
+        return
+    try:
+        with open(json_path, "r") as f:
+            messages = json.load(f)
+    except (OSError, ValueError) as e:
+        # Left where it is for the user to recover; the chat starts with an empty log meanwhile
+        print(f"Error reading chat history {json_path}: {e}")
+        return
+    if not os.path.exists(log_path):
+        tmp_path = f"{log_path}.tmp"
+        with open(tmp_path, "w") as f:
+            for message in messages:
+                f.write(json.dumps(message) + "\n")
+        os.replace(tmp_path, log_path)
+        _rebuild_index(log_path)
+    os.remove(json_path)
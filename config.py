@@ -0,0 +1,105 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Storage ---
+SAVED_PAPERS_DIR = os.environ.get("SAVED_PAPERS_DIR", "saved_papers")
+CACHE_DIR = os.environ.get("CACHE_DIR", ".cache")
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", "paper_blobs")  # PDFs and extracted text shared by all users
+BLOB_GC_GRACE = int(os.environ.get("BLOB_GC_GRACE", 60 * 60))  # seconds an unreferenced blob is kept
+TEXT_BLOCK_CHARS = int(os.environ.get("TEXT_BLOCK_CHARS", 16384))  # characters per compressed block of full text
+TEXT_COMPRESSION_LEVEL = int(os.environ.get("TEXT_COMPRESSION_LEVEL", 6))
+TEXT_READER_CACHE_SIZE = int(os.environ.get("TEXT_READER_CACHE_SIZE", 128))  # memory-mapped texts kept open
+
+# --- Accounts ---
+USERS_DB = os.environ.get("USERS_DB", "users.db")
+AUTH_DB_POOL_SIZE = int(os.environ.get("AUTH_DB_POOL_SIZE", 4))
+AUTH_HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", os.cpu_count() or 2))  # concurrent bcrypt hashes
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+SESSION_SECRET = os.environ.get("SESSION_SECRET")  # generated into SESSION_SECRET_FILE if unset
+SESSION_SECRET_FILE = os.environ.get("SESSION_SECRET_FILE", os.path.join(CACHE_DIR, "session_secret"))
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 7 * 24 * 60 * 60))  # seconds
+
+# --- arXiv search ---
+MAX_SEARCH_RESULTS = int(os.environ.get("MAX_SEARCH_RESULTS", 5000))
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", 100))
+RESULTS_PAGE_SIZE = int(os.environ.get("RESULTS_PAGE_SIZE", 20))
+
+# --- arXiv search cache ---
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 6 * 60 * 60))  # seconds
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 256))
+
+# --- Save pipeline ---
+SAVE_WORKERS = int(os.environ.get("SAVE_WORKERS", 4))
+COMBINED_ANALYSIS = os.environ.get("COMBINED_ANALYSIS", "false").lower() in ("1", "true", "yes")
+
+# --- Gemini ---
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+
+# --- Background ingestion queue ---
+INGEST_QUEUE_DB = os.environ.get("INGEST_QUEUE_DB", "ingest_queue.db")
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", 3))
+INGEST_RETRY_DELAY = float(os.environ.get("INGEST_RETRY_DELAY", 10))  # seconds, doubled per attempt
+
+# --- Batch ingestion (batch_ingest.py) ---
+BATCH_INGEST_WORKERS = int(os.environ.get("BATCH_INGEST_WORKERS", 4))
+BATCH_RESULTS_PER_QUERY = int(os.environ.get("BATCH_RESULTS_PER_QUERY", 25))
+
+# --- PDF fetcher ---
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", os.path.join(CACHE_DIR, "pdfs"))
+PDF_CACHE_MAX_AGE = int(os.environ.get("PDF_CACHE_MAX_AGE", 24 * 60 * 60))  # seconds before revalidating
+PDF_FETCH_TIMEOUT = (10, 60)  # connect, read
+PDF_FETCH_RETRIES = int(os.environ.get("PDF_FETCH_RETRIES", 3))
+PDF_FETCH_BACKOFF = float(os.environ.get("PDF_FETCH_BACKOFF", 1.0))
+PDF_FETCH_POOL_SIZE = int(os.environ.get("PDF_FETCH_POOL_SIZE", 10))
+
+# --- PDF text extraction ---
+PAGE_CACHE_DB = os.environ.get("PAGE_CACHE_DB", os.path.join(CACHE_DIR, "page_text.db"))
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", os.cpu_count() or 2))
+EXTRACT_PAGES_PER_TASK = int(os.environ.get("EXTRACT_PAGES_PER_TASK", 4))
+EXTRACT_MIN_PARALLEL_PAGES = int(os.environ.get("EXTRACT_MIN_PARALLEL_PAGES", 12))
+EXTRACT_PAGE_TIMEOUT = int(os.environ.get("EXTRACT_PAGE_TIMEOUT", 20))  # seconds
+
+# --- Library sidebar ---
+LIBRARY_PAGE_SIZE = int(os.environ.get("LIBRARY_PAGE_SIZE", 20))
+
+# --- Chat retrieval ---
+CHUNK_CHARS = int(os.environ.get("CHUNK_CHARS", 1500))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", 200))
+CHAT_CONTEXT_CHARS = int(os.environ.get("CHAT_CONTEXT_CHARS", 8000))
+CHAT_TOP_K = int(os.environ.get("CHAT_TOP_K", 8))
+INDEX_CACHE_SIZE = int(os.environ.get("INDEX_CACHE_SIZE", 32))
+CHAT_HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", 3000))
+CHAT_SUMMARY_TOKENS = int(os.environ.get("CHAT_SUMMARY_TOKENS", 400))
+CHAT_LOAD_LAST = int(os.environ.get("CHAT_LOAD_LAST", 50))
+
+# --- Multi-paper questions ---
+MULTI_QA_WORKERS = int(os.environ.get("MULTI_QA_WORKERS", 4))  # concurrent per-paper answers, process-wide
+MULTI_QA_MAX_PAPERS = int(os.environ.get("MULTI_QA_MAX_PAPERS", 8))
+MULTI_QA_CONTEXT_CHARS = int(os.environ.get("MULTI_QA_CONTEXT_CHARS", 4000))  # excerpts per paper
+MULTI_QA_TIMEOUT = int(os.environ.get("MULTI_QA_TIMEOUT", 120))  # seconds a started paper may go without output
+
+# --- Related papers ---
+SIMILARITY_DIM = int(os.environ.get("SIMILARITY_DIM", 1024))  # hashed n-gram buckets per paper vector
+RELATED_TOP_K = int(os.environ.get("RELATED_TOP_K", 3))
+RELATED_MIN_SIMILARITY = float(os.environ.get("RELATED_MIN_SIMILARITY", 0.15))
+NEAR_DUPLICATE_SIMILARITY = float(os.environ.get("NEAR_DUPLICATE_SIMILARITY", 0.7))
+
+# --- PDF serving ---
+STATIC_PDF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "pdfs")
+
+# --- Gemini response cache ---
+LLM_CACHE_DB = os.environ.get("LLM_CACHE_DB", os.path.join(CACHE_DIR, "llm_cache.db"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# --- Search analytics ---
+ANALYTICS_CACHE_SIZE = int(os.environ.get("ANALYTICS_CACHE_SIZE", 32))
+
+# --- Metrics ---
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(CACHE_DIR, "metrics"))
+METRICS_SAMPLE_INTERVAL = float(os.environ.get("METRICS_SAMPLE_INTERVAL", 5))  # seconds
+METRICS_HISTORY = int(os.environ.get("METRICS_HISTORY", 500))  # recent observations kept per stage
+ADMIN_USERS = {name.strip().lower() for name in os.environ.get("ADMIN_USERS", "").split(",") if name.strip()}
@@ -1,34 +1,124 @@
 
+import os
+import hmac
+import time
+import queue
+import base64
+import secrets
 import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
 
+import config
+
+SCHEMA_VERSION = 3
+
+_pool = queue.LifoQueue()
+_pool_lock = threading.Lock()
+_pool_size = 0
+_migrated = False
+_secret = None
+
+# bcrypt releases the GIL, so a pool of one worker per core hashes a login burst
+# in parallel without oversubscribing the CPU the other sessions' scripts run on
+_hasher = ThreadPoolExecutor(max_workers=config.AUTH_HASH_WORKERS, thread_name_prefix="auth-hash")
+
+
 def create_connection():
     """Creates a database connection."""
-    conn = sqlite3.connect('users.db')
+    conn = sqlite3.connect(config.USERS_DB, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     return conn
 
+
 def create_table(conn):
-    """Creates the users table if it doesn't exist."""
-    try:
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL
-            )
-        """)
-        conn.commit()
+    """Brings the users database up to the current schema version."""
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with conn:
+            if version < 1:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username TEXT NOT NULL UNIQUE,
+                        password TEXT NOT NULL
+                    )
+                """)
+            if version < 2:
+                # Bumped on logout to revoke every session token issued before it
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+                if 'token_epoch' not in columns:
+                    conn.execute("ALTER TABLE users ADD COLUMN token_epoch INTEGER NOT NULL DEFAULT 0")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS settings (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL
+                    )
+                """)
+            if version < 3:
+                # Signing keys now live outside this file, which may be versioned; tokens signed with it stop working
+                conn.execute("DELETE FROM settings WHERE key = 'session_secret'")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     except sqlite3.Error as e:
         print(f"Error creating table: {e}")
+        raise
+
+
+@contextmanager
+def connection():
+    """Borrows a connection from the process-wide pool, migrating the schema on first use.
+
+    A failed migration raises and is retried by the next borrower.
+    """
+    global _pool_size, _migrated
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        with _pool_lock:
+            grow = _pool_size < config.AUTH_DB_POOL_SIZE
+            if grow:
+                _pool_size += 1
+        conn = create_connection() if grow else _pool.get()
+    try:
+        if not _migrated:
+            with _pool_lock:
+                if not _migrated:
+                    create_table(conn)
+                    _migrated = True
+        yield conn
+    finally:
+        _pool.put(conn)
 
-def add_user(conn, username, password):
+
+def _hash_password(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=config.BCRYPT_ROUNDS))
+
+
+def _check_password(password, stored_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), stored_hash)
+
+
+def _rounds(stored_hash):
+    # bcrypt hashes look like $2b$<cost>$<salt and hash>
+    try:
+        return int(stored_hash.split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def add_user(username, password):
     """Adds a new user to the database with an encrypted password."""
+    hashed_password = _hasher.submit(_hash_password, password).result()
     try:
-        c = conn.cursor()
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-        c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username.lower(), hashed_password))
-        conn.commit()
+        with connection() as conn, conn:
+            conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username.lower(), hashed_password))
         return True
     except sqlite3.IntegrityError:
         return False  # Username already exists
@@ -36,15 +126,116 @@ def add_user(conn, username, password):
         print(f"Error adding user: {e}")
         return False
 
-def check_user(conn, username, password):
+
+def check_user(username, password):
     """Checks if a user exists and the password is correct."""
     try:
-        c = conn.cursor()
-        c.execute("SELECT password FROM users WHERE username = ?", (username.lower(),))
-        stored_password_hash = c.fetchone()
-        if stored_password_hash:
-            return bcrypt.checkpw(password.encode('utf-8'), stored_password_hash[0])
+        with connection() as conn:
+            row = conn.execute("SELECT password FROM users WHERE username = ?", (username.lower(),)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Error checking user: {e}")
+        return False
+    if not row:
+        return False
+    stored_hash = row[0] if isinstance(row[0], bytes) else row[0].encode('utf-8')
+    if not _hasher.submit(_check_password, password, stored_hash).result():
         return False
+    if _rounds(stored_hash) != config.BCRYPT_ROUNDS:
+        # Rehash passwords stored at an older cost now that the plaintext is at hand
+        _hasher.submit(_rehash, username.lower(), password)
+    return True
+
+
+def user_exists(username):
+    """Checks if an account with this username exists."""
+    try:
+        with connection() as conn:
+            return conn.execute("SELECT 1 FROM users WHERE username = ?", (username.lower(),)).fetchone() is not None
     except sqlite3.Error as e:
         print(f"Error checking user: {e}")
         return False
+
+
+def _rehash(username, password):
+    try:
+        with connection() as conn, conn:
+            conn.execute("UPDATE users SET password = ? WHERE username = ?", (_hash_password(password), username))
+    except sqlite3.Error as e:
+        print(f"Error rehashing password: {e}")
+
+
+# --- Session Tokens ---
+def _get_secret():
+    """Returns the token signing key: SESSION_SECRET if set, else one generated once into SESSION_SECRET_FILE."""
+    global _secret
+    if _secret is None:
+        if config.SESSION_SECRET:
+            _secret = config.SESSION_SECRET.encode('utf-8')
+        else:
+            _secret = _load_or_create_secret(config.SESSION_SECRET_FILE)
+    return _secret
+
+
+def _load_or_create_secret(path):
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+        try:
+            # Linking fails if another process got there first, so every process ends up with the same key
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, "r") as f:
+        return f.read().strip().encode('utf-8')
+
+
+def _sign(payload):
+    return hmac.new(_get_secret(), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _token_epoch(username):
+    with connection() as conn:
+        row = conn.execute("SELECT token_epoch FROM users WHERE username = ?", (username,)).fetchone()
+    return row[0] if row else None
+
+
+def issue_token(username):
+    """Returns a signed session token for a user that expires after SESSION_TTL seconds."""
+    username = username.lower()
+    payload = f"{username}|{int(time.time()) + config.SESSION_TTL}|{_token_epoch(username)}"
+    token = f"{payload}|{_sign(payload)}"
+    return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+
+
+def verify_token(token):
+    """Returns the username a session token was issued to, or None if it is invalid, expired or revoked."""
+    try:
+        username, expires, epoch, signature = base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8').rsplit('|', 3)
+        expires, epoch = int(expires), int(epoch)
+    except (ValueError, UnicodeError):
+        return None
+    if not hmac.compare_digest(signature, _sign(f"{username}|{expires}|{epoch}")):
+        return None
+    if expires < time.time():
+        return None
+    try:
+        if _token_epoch(username) != epoch:
+            return None
+    except sqlite3.Error as e:
+        print(f"Error verifying session token: {e}")
+        return None
+    return username
+
+
+def revoke_tokens(username):
+    """Invalidates every session token issued to a user so far."""
+    try:
+        with connection() as conn, conn:
+            conn.execute("UPDATE users SET token_epoch = token_epoch + 1 WHERE username = ?", (username.lower(),))
+    except sqlite3.Error as e:
+        print(f"Error revoking session tokens: {e}")
@@ -0,0 +1,146 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import config
+import llm
+import metrics
+import blob_store
+import pdf_extract
+import pdf_fetcher
+import paper_index
+import paper_store
+
+
+def safe_filename(title):
+    """Returns the sanitized title used for saved paper file names."""
+    return "".join(c for c in title if c.isalnum() or c in (' ', '_')).rstrip()
+
+
+def paper_from_result(result):
+    """Converts an arxiv.Result into the plain dict the save path works on."""
+    return {
+        'title': result.title,
+        'authors': [a.name for a in result.authors],
+        'pdf_url': result.pdf_url,
+        'summary': result.summary,
+        'entry_id': result.entry_id,
+        'published': result.published.strftime('%Y-%m-%d'),
+    }
+
+
+# --- Task Runner ---
+def run_tasks(tasks, max_workers=config.SAVE_WORKERS):
+    """Runs a dependency graph of tasks on a thread pool.
+
+    `tasks` maps a name to `(func, deps)`. Each func is called with the results
+    of its dependencies as keyword arguments, as soon as all of them are done.
+    Returns a dict of results by task name; the first failure is re-raised.
+    """
+    results = {}
+    pending = dict(tasks)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    kwargs = {dep: results[dep] for dep in deps}
+                    running[executor.submit(func, **kwargs)] = name
+                    del pending[name]
+            if not running:
+                raise ValueError(f"Unsatisfiable task dependencies: {sorted(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+    return results
+
+
+# --- Pipeline Stages ---
+def generate_summary(model, abstract):
+    """Asks Gemini for a summary of the paper."""
+    return llm.generate(model, f"Summarize this research paper: {abstract}")
+
+
+def generate_drawbacks(model, abstract):
+    """Asks Gemini for the paper's limitations and drawbacks."""
+    return llm.generate(model, f"Analyze this research paper and identify its limitations and drawbacks: {abstract}")
+
+
+def generate_analysis(model, abstract):
+    """Asks Gemini for the summary and drawbacks in a single structured call."""
+    prompt = (
+        "Analyze this research paper. Respond with a JSON object with two string fields: "
+        "\"summary\", a summary of the paper, and \"drawbacks\", its limitations and drawbacks.\n\n"
+        f"{abstract}"
+    )
+    response_text = llm.generate(model, prompt, generation_config={"response_mime_type": "application/json"})
+    try:
+        analysis = json.loads(response_text)
+        return {'summary': analysis['summary'], 'drawbacks': analysis['drawbacks']}
+    except (ValueError, KeyError, TypeError):
+        return {
+            'summary': generate_summary(model, abstract),
+            'drawbacks': generate_drawbacks(model, abstract),
+        }
+
+
+def download_pdf(url):
+    """Fetches a PDF through the shared cache and adds it to the blob store. Returns its content hash."""
+    return blob_store.put_pdf(pdf_fetcher.fetch_pdf(url))
+
+
+def store_text(entry_id, pdf_sha256, full_text):
+    """Adds extracted text to the blob store and records what the entry resolved to."""
+    text_sha256 = blob_store.put_text(full_text)
+    if entry_id:
+        blob_store.record_entry(entry_id, pdf_sha256, text_sha256)
+    return text_sha256
+
+
+@metrics.timed("index_build")
+def build_index(text_sha256, full_text):
+    """Builds the shared retrieval index for a text blob unless it already exists."""
+    path = blob_store.index_path(text_sha256)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        paper_index.save_index(path, paper_index.build_index(full_text))
+    return path
+
+
+def save_paper(model, paper, username, combined_analysis=config.COMBINED_ANALYSIS):
+    """Analyzes, downloads and stores a paper, running independent steps concurrently.
+
+    Papers another user has already saved are served from the blob store, so
+    only the analysis runs again.
+    """
+    safe_title = safe_filename(paper['title'])
+    os.makedirs(paper_store.user_folder(username), exist_ok=True)
+    stored = blob_store.lookup_entry(paper.get('entry_id'))
+
+    if stored:
+        tasks = {
+            'pdf_sha256': (lambda: stored['pdf_sha256'], []),
+            'full_text': (lambda: blob_store.read_text(stored['text_sha256']), []),
+            'text_sha256': (lambda: stored['text_sha256'], []),
+        }
+    else:
+        tasks = {
+            'pdf_sha256': (lambda: download_pdf(paper['pdf_url']), []),
+            'full_text': (lambda pdf_sha256: pdf_extract.extract_text(blob_store.path(blob_store.PDF, pdf_sha256)), ['pdf_sha256']),
+            'text_sha256': (lambda pdf_sha256, full_text: store_text(paper.get('entry_id'), pdf_sha256, full_text),
+                            ['pdf_sha256', 'full_text']),
+        }
+    tasks['index'] = (build_index, ['text_sha256', 'full_text'])
+    tasks['saved'] = (lambda summary, drawbacks, full_text, pdf_sha256, index:
+                      paper_store.save_paper(username, safe_title, paper, summary, drawbacks, full_text, pdf_sha256),
+                      ['summary', 'drawbacks', 'full_text', 'pdf_sha256', 'index'])
+    if combined_analysis:
+        tasks['analysis'] = (lambda: generate_analysis(model, paper['summary']), [])
+        tasks['summary'] = (lambda analysis: analysis['summary'], ['analysis'])
+        tasks['drawbacks'] = (lambda analysis: analysis['drawbacks'], ['analysis'])
+    else:
+        tasks['summary'] = (lambda: generate_summary(model, paper['summary']), [])
+        tasks['drawbacks'] = (lambda: generate_drawbacks(model, paper['summary']), [])
+
+    return run_tasks(tasks)
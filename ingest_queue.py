@@ -0,0 +1,169 @@
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+
+import config
+import ingest
+import llm
+import paper_store
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_wakeup = threading.Event()
+_start_lock = threading.Lock()
+_workers = []
+
+
+def _connect():
+    conn = sqlite3.connect(config.INGEST_QUEUE_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def create_table():
+    """Creates the jobs table and requeues jobs interrupted by a restart."""
+    with closing(_connect()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                entry_id TEXT NOT NULL,
+                paper TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                available_at REAL NOT NULL DEFAULT 0,
+                updated REAL NOT NULL,
+                UNIQUE (username, entry_id)
+            )
+        """)
+        conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+
+
+def enqueue(username, papers):
+    """Adds papers to a user's ingestion queue. Returns the number queued."""
+    queued = 0
+    with closing(_connect()) as conn, conn:
+        for paper in papers:
+            cur = conn.execute("""
+                INSERT INTO jobs (username, entry_id, paper, status, updated) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (username, entry_id) DO UPDATE
+                SET paper = excluded.paper, status = excluded.status, attempts = 0, error = NULL, available_at = 0, updated = excluded.updated
+                WHERE jobs.status IN (?, ?)
+            """, (username, paper['entry_id'], json.dumps(paper), QUEUED, time.time(), DONE, FAILED))
+            queued += cur.rowcount
+    _wakeup.set()
+    return queued
+
+
+def retry_failed(username):
+    """Puts a user's failed jobs back on the queue."""
+    with closing(_connect()) as conn, conn:
+        cur = conn.execute("UPDATE jobs SET status = ?, attempts = 0, error = NULL, available_at = 0, updated = ? WHERE username = ? AND status = ?",
+                           (QUEUED, time.time(), username, FAILED))
+    _wakeup.set()
+    return cur.rowcount
+
+
+def clear_finished(username):
+    """Removes a user's completed jobs from the queue."""
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM jobs WHERE username = ? AND status = ?", (username, DONE))
+
+
+def progress(username):
+    """Returns job counts per status for a user."""
+    counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+    with closing(_connect()) as conn, conn:
+        for status, count in conn.execute("SELECT status, COUNT(*) FROM jobs WHERE username = ? GROUP BY status", (username,)):
+            counts[status] = count
+    return counts
+
+
+def statuses(username):
+    """Returns a mapping of entry_id to job status for a user."""
+    with closing(_connect()) as conn, conn:
+        return dict(conn.execute("SELECT entry_id, status FROM jobs WHERE username = ?", (username,)))
+
+
+def _claim_job():
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT id, username, paper, attempts FROM jobs WHERE status = ? AND available_at <= ? ORDER BY id LIMIT 1",
+                           (QUEUED, time.time())).fetchone()
+        if row:
+            conn.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                         (RUNNING, time.time(), row[0]))
+        conn.commit()
+        return row
+    finally:
+        conn.close()
+
+
+def _finish_job(job_id, status, error=None, delay=0):
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute("UPDATE jobs SET status = ?, error = ?, available_at = ?, updated = ? WHERE id = ?",
+                     (status, error, now + delay, now, job_id))
+
+
+def _process(job):
+    job_id, username, paper_json, attempts = job
+    paper = json.loads(paper_json)
+    if ingest.safe_filename(paper['title']) in paper_store.saved_titles(username):
+        _finish_job(job_id, DONE)
+        return
+    try:
+        model = llm.get_model()
+        if model is None:
+            raise RuntimeError("GEMINI_API_KEY is not set.")
+        ingest.save_paper(model, paper, username)
+        _finish_job(job_id, DONE)
+    except Exception as e:
+        print(f"Error ingesting '{paper['title']}': {e}")
+        # Jobs claimed fewer than the allowed number of times go back on the queue, with backoff
+        if attempts + 1 < config.INGEST_MAX_ATTEMPTS:
+            _finish_job(job_id, QUEUED, str(e), delay=config.INGEST_RETRY_DELAY * 2 ** attempts)
+        else:
+            _finish_job(job_id, FAILED, str(e))
+
+
+def _worker_loop():
+    while True:
+        try:
+            job = _claim_job()
+        except sqlite3.Error as e:
+            print(f"Error reading ingestion queue: {e}")
+            job = None
+        if job is None:
+            _wakeup.wait(timeout=5)
+            _wakeup.clear()
+            continue
+        try:
+            _process(job)
+        except Exception as e:
+            # Anything _process doesn't handle itself (a malformed payload, a database error
+            # outside save_paper) must not kill the worker or leave the job stuck as running
+            print(f"Error processing ingestion job {job[0]}: {e}")
+            try:
+                _finish_job(job[0], FAILED, str(e))
+            except sqlite3.Error as e:
+                print(f"Error updating ingestion job {job[0]}: {e}")
+
+
+def start_workers():
+    """Starts the process-wide worker pool once."""
+    with _start_lock:
+        if _workers:
+            return
+        create_table()
+        for i in range(config.INGEST_WORKERS):
+            worker = threading.Thread(target=_worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
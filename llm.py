@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing
+
+import config
+import metrics
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Returns the process-wide Gemini model, or None if no API key is set.
+
+    google.generativeai is imported and configured on first use, so pages
+    that never call Gemini don't pay for loading it.
+    """
+    global _model
+    if not config.GEMINI_API_KEY:
+        return None
+    with _model_lock:
+        if _model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=config.GEMINI_API_KEY)
+            _model = genai.GenerativeModel(config.GEMINI_MODEL)
+    return _model
+
+
+# --- Response Cache ---
+def _connect():
+    os.makedirs(os.path.dirname(config.LLM_CACHE_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(config.LLM_CACHE_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            chunks TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_access REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def cache_key(model, contents, params):
+    """Hashes the model name, prompt or history, and generation parameters."""
+    model_name = getattr(model, 'model_name', type(model).__name__)
+    raw = json.dumps([model_name, contents, params], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _lookup(key):
+    try:
+        with closing(_connect()) as conn, conn:
+            row = conn.execute("SELECT chunks FROM responses WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+    except sqlite3.Error as e:
+        print(f"Error reading response cache: {e}")
+        row = None
+    with _stats_lock:
+        _stats['hits' if row else 'misses'] += 1
+    return json.loads(row[0]) if row else None
+
+
+def _store(key, chunks):
+    data = json.dumps(chunks)
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO responses (key, chunks, size, last_access) VALUES (?, ?, ?, ?)",
+                         (key, data, len(data), time.time()))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > config.LLM_CACHE_MAX_BYTES:
+                # Evict least recently used responses until the cache fits again
+                excess = total - config.LLM_CACHE_MAX_BYTES
+                freed = 0
+                for old_key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                    if freed >= excess:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    freed += size
+    except sqlite3.Error as e:
+        print(f"Error writing response cache: {e}")
+
+
+def _chunk_texts(response):
+    for chunk in response:
+        try:
+            yield chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. safety metadata) carry nothing to show
+            pass
+
+
+def _replay(chunks):
+    yield from chunks
+
+
+def _stream_and_store(key, texts):
+    chunks = []
+    for text in texts:
+        chunks.append(text)
+        yield text
+    _store(key, chunks)
+
+
+def generate(model, contents, stream=False, use_cache=True, **params):
+    """Calls `model.generate_content`, serving repeated requests from the response cache.
+
+    Returns the response text, or with `stream=True` an iterator of text chunks.
+    Cached streams are replayed chunk by chunk. Pass `use_cache=False` to always
+    call the model.
+    """
+    if not use_cache:
+        return _call(model, contents, stream, params)
+
+    key = cache_key(model, contents, params)
+    chunks = _lookup(key)
+    if chunks is not None:
+        return _replay(chunks) if stream else "".join(chunks)
+
+    if stream:
+        return _stream_and_store(key, _call(model, contents, stream, params))
+    text = _call(model, contents, stream, params)
+    _store(key, [text])
+    return text
+
+
+def _call(model, contents, stream, params):
+    """Calls the model, timing each call and, for streams, the time to the first chunk."""
+    if stream:
+        start = time.perf_counter()
+        response = model.generate_content(contents, stream=True, **params)
+        return metrics.timed_stream(_chunk_texts(response), "gemini_stream", "gemini_first_token", start=start)
+    with metrics.timed("gemini_call"):
+        return model.generate_content(contents, **params).text
+
+
+def cache_stats():
+    """Returns response cache hit/miss counters for this process."""
+    with _stats_lock:
+        total = _stats['hits'] + _stats['misses']
+        return {**_stats, 'hit_rate': _stats['hits'] / total if total else 0.0}
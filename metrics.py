@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import ContextDecorator
+
+import psutil
+
+import config
+
+# Upper bounds in seconds of the Prometheus histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_stages = {}
+_stages_lock = threading.Lock()
+_process = psutil.Process()
+_resources = {'rss_bytes': 0, 'peak_rss_bytes': 0, 'cpu_percent': 0.0, 'threads': 0}
+_history = deque(maxlen=config.METRICS_HISTORY)
+_start_lock = threading.Lock()
+_sampler = None
+_startup_recorded = False
+
+
+class _Stage:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=config.METRICS_HISTORY)
+
+    def add(self, seconds, failed):
+        self.count += 1
+        self.errors += failed
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        self.recent.append(seconds)
+
+
+def observe(stage, seconds, failed=False):
+    """Records one duration of a stage."""
+    with _stages_lock:
+        if stage not in _stages:
+            _stages[stage] = _Stage()
+        _stages[stage].add(seconds, failed)
+
+
+class timed(ContextDecorator):
+    """Times a block or function as one observation of `stage`.
+
+    Usable as `with metrics.timed("stage"):` or as a `@metrics.timed("stage")`
+    decorator. Blocks that raise an Exception are counted as errors; Streamlit's
+    rerun and stop signals are not.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self._starts = threading.local()
+
+    def __enter__(self):
+        self._starts.__dict__.setdefault('stack', []).append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        failed = exc_type is not None and issubclass(exc_type, Exception)
+        observe(self.stage, time.perf_counter() - self._starts.stack.pop(), failed=failed)
+        return False
+
+
+def timed_stream(chunks, stage, first_stage=None, start=None):
+    """Passes a stream through, recording the total time and, as `first_stage`, the time to the first chunk.
+
+    Times are measured from `start` (a `time.perf_counter()` value) if given,
+    else from when the stream is first consumed.
+    """
+    start = time.perf_counter() if start is None else start
+    first = True
+    failed = False
+    try:
+        for chunk in chunks:
+            if first and first_stage:
+                observe(first_stage, time.perf_counter() - start)
+            first = False
+            yield chunk
+    except Exception:
+        failed = True
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, failed=failed)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def stage_stats():
+    """Returns per-stage counts and latencies in seconds; percentiles cover recent observations."""
+    with _stages_lock:
+        return {
+            name: {
+                'count': stage.count,
+                'errors': stage.errors,
+                'mean': stage.total / stage.count if stage.count else 0.0,
+                'p50': _percentile(stage.recent, 0.5),
+                'p95': _percentile(stage.recent, 0.95),
+                'max': stage.max,
+            }
+            for name, stage in sorted(_stages.items())
+        }
+
+
+def record_startup(seconds):
+    """Records the duration of the process's first script run as the `startup` stage.
+
+    Later runs are ignored: only the first pays for importing the app's modules.
+    """
+    global _startup_recorded
+    with _start_lock:
+        if _startup_recorded:
+            return
+        _startup_recorded = True
+    observe("startup", seconds)
+
+
+# --- Resource Sampling ---
+def sample():
+    """Samples process RSS, CPU and thread count."""
+    rss = _process.memory_info().rss
+    _resources.update({
+        'rss_bytes': rss,
+        'peak_rss_bytes': max(_resources['peak_rss_bytes'], rss),
+        'cpu_percent': _process.cpu_percent(),
+        'threads': _process.num_threads(),
+    })
+    _history.append((time.time(), rss, _resources['cpu_percent']))
+    return dict(_resources)
+
+
+def latest():
+    """Returns the most recent resource sample without taking a new one."""
+    return dict(_resources)
+
+
+def resource_history():
+    """Returns recent (timestamp, rss_bytes, cpu_percent) samples."""
+    return list(_history)
+
+
+def _sample_loop():
+    while True:
+        sample()
+        try:
+            write_files()
+        except OSError as e:
+            print(f"Could not write metrics files: {e}")
+        time.sleep(config.METRICS_SAMPLE_INTERVAL)
+
+
+def start_sampler():
+    """Starts the background resource sampler and metrics file writer once per process."""
+    global _sampler
+    with _start_lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="metrics-sampler", daemon=True)
+            _sampler.start()
+
+
+# --- Export ---
+def snapshot():
+    """Returns all metrics as a JSON-serializable dict."""
+    return {'timestamp': time.time(), 'process': dict(_resources), 'stages': stage_stats()}
+
+
+def to_prometheus():
+    """Renders the metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP app_process_resident_memory_bytes Resident set size of the app process.",
+        "# TYPE app_process_resident_memory_bytes gauge",
+        f"app_process_resident_memory_bytes {_resources['rss_bytes']}",
+        "# HELP app_process_peak_resident_memory_bytes Highest sampled resident set size.",
+        "# TYPE app_process_peak_resident_memory_bytes gauge",
+        f"app_process_peak_resident_memory_bytes {_resources['peak_rss_bytes']}",
+        "# HELP app_process_cpu_percent CPU use of the app process since the previous sample.",
+        "# TYPE app_process_cpu_percent gauge",
+        f"app_process_cpu_percent {_resources['cpu_percent']}",
+        "# HELP app_process_threads Threads in the app process.",
+        "# TYPE app_process_threads gauge",
+        f"app_process_threads {_resources['threads']}",
+        "# HELP app_stage_duration_seconds Duration of instrumented stages.",
+        "# TYPE app_stage_duration_seconds histogram",
+    ]
+    with _stages_lock:
+        for name, stage in sorted(_stages.items()):
+            for bound, count in zip(BUCKETS, stage.buckets):
+                lines.append(f'app_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'app_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {stage.count}')
+            lines.append(f'app_stage_duration_seconds_sum{{stage="{name}"}} {stage.total}')
+            lines.append(f'app_stage_duration_seconds_count{{stage="{name}"}} {stage.count}')
+        lines.append("# HELP app_stage_errors_total Instrumented stage runs that raised.")
+        lines.append("# TYPE app_stage_errors_total counter")
+        for name, stage in sorted(_stages.items()):
+            lines.append(f'app_stage_errors_total{{stage="{name}"}} {stage.errors}')
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_files():
+    """Writes metrics.prom and metrics.json into METRICS_DIR, e.g. for a node_exporter textfile collector."""
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    _write_atomic(os.path.join(config.METRICS_DIR, "metrics.prom"), to_prometheus())
+    _write_atomic(os.path.join(config.METRICS_DIR, "metrics.json"), json.dumps(snapshot(), indent=2))
@@ -0,0 +1,101 @@
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import llm
+import metrics
+import paper_index
+import paper_store
+
+CHUNK = 'chunk'
+DONE = 'done'
+ERROR = 'error'
+STARTED = 'started'  # sent by a paper's task when it leaves the pool's queue; not yielded
+
+# Shared by all sessions, so a burst of multi-paper questions can't open an unbounded number of Gemini streams
+_executor = ThreadPoolExecutor(max_workers=config.MULTI_QA_WORKERS, thread_name_prefix="multi-qa")
+
+
+def _answer(model, username, safe_title, question, events, cancelled):
+    # Tasks of an abandoned question may still be queued behind other sessions' work
+    if cancelled.is_set():
+        return
+    events.put((safe_title, STARTED, None))
+    try:
+        with metrics.timed("multi_qa_paper"):
+            paper = paper_store.load_paper(username, safe_title)
+            if paper is None:
+                raise ValueError("the paper is no longer in the library")
+            index = paper_store.load_index(username, safe_title)
+            excerpts = paper_index.retrieve(index, question, budget=config.MULTI_QA_CONTEXT_CHARS)
+            prompt = (
+                f"Answer the question using the excerpts from this research paper.\n\n"
+                f"Title: {paper['title']}\n\nExcerpts:\n" + "\n\n[...]\n\n".join(excerpts) +
+                f"\n\nQuestion: {question}"
+            )
+            for text in llm.generate(model, prompt, stream=True):
+                if cancelled.is_set():
+                    return
+                events.put((safe_title, CHUNK, text))
+        events.put((safe_title, DONE, None))
+    except Exception as e:
+        events.put((safe_title, ERROR, str(e)))
+
+
+def stream_answers(model, username, safe_titles, question):
+    """Answers a question about each saved paper concurrently, yielding events as they arrive.
+
+    Retrieval and generation run on a bounded pool, so the total time is close
+    to that of the slowest paper. Events are `(safe_title, kind, text)` tuples:
+    a CHUNK of answer text, then DONE, or ERROR with a message. They are
+    yielded on the calling thread, which can therefore draw them. Closing the
+    generator early stops the remaining streams. A paper whose task has
+    started but produced nothing for MULTI_QA_TIMEOUT seconds gets an ERROR
+    and is stopped; time spent queued behind other questions doesn't count.
+    """
+    events = queue.Queue()
+    cancelled = {safe_title: threading.Event() for safe_title in safe_titles}
+    for safe_title in safe_titles:
+        _executor.submit(_answer, model, username, safe_title, question, events, cancelled[safe_title])
+    remaining = set(safe_titles)
+    deadlines = {}  # monotonic time at which each started, unfinished paper counts as stalled
+    try:
+        while remaining:
+            timeout = max(0, min(deadlines.values()) - time.monotonic()) if deadlines else None
+            try:
+                safe_title, kind, text = events.get(timeout=timeout)
+            except queue.Empty:
+                now = time.monotonic()
+                for safe_title in [title for title in safe_titles if title in deadlines and deadlines[title] <= now]:
+                    del deadlines[safe_title]
+                    remaining.discard(safe_title)
+                    cancelled[safe_title].set()
+                    yield safe_title, ERROR, f"no answer after {config.MULTI_QA_TIMEOUT} seconds"
+                continue
+            if safe_title not in remaining:
+                continue  # a paper that already timed out
+            if kind == CHUNK or kind == STARTED:
+                deadlines[safe_title] = time.monotonic() + config.MULTI_QA_TIMEOUT
+                if kind == STARTED:
+                    continue
+            else:
+                remaining.discard(safe_title)
+                deadlines.pop(safe_title, None)
+            yield safe_title, kind, text
+    finally:
+        for event in cancelled.values():
+            event.set()
+
+
+def synthesize(model, question, answers):
+    """Streams one answer merging the per-paper answers, given as a {title: answer} dict."""
+    sections = "\n\n".join(f"Paper: {title}\nAnswer: {answer}" for title, answer in answers.items())
+    prompt = (
+        "Several research papers were each asked the same question. Using only their answers below, "
+        "write one answer that compares the papers, noting where they agree, where they differ, and "
+        "which paper each point comes from.\n\n"
+        f"Question: {question}\n\n{sections}"
+    )
+    return llm.generate(model, prompt, stream=True)
@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+import config
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# The vocab is a fixed-width string array, so one run-together word, URL or hash would widen every entry
+MAX_TOKEN_CHARS = 32
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were which with we our
+""".split())
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Lowercases and splits text into index terms, skipping single characters and overlong runs."""
+    return [token for token in TOKEN_RE.findall(text.lower())
+            if 1 < len(token) <= MAX_TOKEN_CHARS and token not in STOPWORDS]
+
+
+def chunk_text(text, size=config.CHUNK_CHARS, overlap=config.CHUNK_OVERLAP):
+    """Splits text into overlapping (start, end) character ranges, preferring whitespace boundaries."""
+    spans = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            boundary = text.rfind("\n", start + size // 2, end)
+            if boundary == -1:
+                boundary = text.rfind(" ", start + size // 2, end)
+            if boundary != -1:
+                end = boundary + 1
+        spans.append((start, end))
+        if end == len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+def build_index(text):
+    """Chunks a paper's text and builds a term-major BM25 index over the chunks.
+
+    The index keeps only the chunks' character spans; their text is read from
+    the paper's stored text when retrieved.
+    """
+    spans = chunk_text(text)
+    chunks = [text[start:end] for start, end in spans]
+    term_counts = [Counter(tokenize(chunk)) for chunk in chunks]
+    vocab = sorted(set().union(*term_counts)) if term_counts else []
+    term_ids = {term: i for i, term in enumerate(vocab)}
+
+    postings = [[] for _ in vocab]
+    for chunk_id, counts in enumerate(term_counts):
+        for term, count in counts.items():
+            postings[term_ids[term]].append((chunk_id, count))
+
+    term_indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    term_indptr[1:] = np.cumsum([len(p) for p in postings])
+    flat = [posting for term_postings in postings for posting in term_postings]
+    return {
+        'vocab': np.array(vocab, dtype=str),
+        'term_indptr': term_indptr,
+        'term_chunks': np.array([chunk_id for chunk_id, _ in flat], dtype=np.int32),
+        'term_tf': np.array([count for _, count in flat], dtype=np.float32),
+        'chunk_len': np.array([sum(counts.values()) for counts in term_counts], dtype=np.float32),
+        'spans': np.array(spans, dtype=np.int64).reshape(-1, 2),
+    }
+
+
+def save_index(path, index):
+    """Writes an index next to its paper."""
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **index)
+    os.replace(tmp_path, path)
+
+
+def load_index(path):
+    """Loads an index, reusing recently loaded ones until the file changes."""
+    mtime = os.stat(path).st_mtime_ns
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached and cached[0] == mtime:
+            _loaded.move_to_end(path)
+            return cached[1]
+    with np.load(path, allow_pickle=False) as data:
+        # Older indexes also hold a copy of every chunk's text, which is never loaded now
+        index = {key: data[key] for key in data.files if key != 'chunks'}
+    with _loaded_lock:
+        _loaded[path] = (mtime, index)
+        while len(_loaded) > config.INDEX_CACHE_SIZE:
+            _loaded.popitem(last=False)
+    return index
+
+
+def search(index, query, top_k=None):
+    """Returns (chunk_id, score) pairs for the best BM25 matches of a query."""
+    chunk_count = len(index['chunk_len'])
+    if not chunk_count:
+        return []
+    scores = np.zeros(chunk_count, dtype=np.float32)
+    avg_len = max(float(index['chunk_len'].mean()), 1.0)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * index['chunk_len'] / avg_len)
+    vocab = index['vocab']
+    for term in set(tokenize(query)):
+        pos = int(np.searchsorted(vocab, term))
+        if pos >= len(vocab) or vocab[pos] != term:
+            continue
+        start, end = index['term_indptr'][pos], index['term_indptr'][pos + 1]
+        chunk_ids = index['term_chunks'][start:end]
+        tf = index['term_tf'][start:end]
+        idf = np.log(1 + (chunk_count - len(chunk_ids) + 0.5) / (len(chunk_ids) + 0.5))
+        scores[chunk_ids] += idf * tf * (BM25_K1 + 1) / (tf + norm[chunk_ids])
+
+    ranked = np.argsort(-scores, kind="stable")
+    ranked = ranked[scores[ranked] > 0]
+    if top_k is not None:
+        ranked = ranked[:top_k]
+    return [(int(chunk_id), float(scores[chunk_id])) for chunk_id in ranked]
+
+
+def retrieve(index, query, budget=config.CHAT_CONTEXT_CHARS, top_k=config.CHAT_TOP_K):
+    """Returns the most relevant chunks for a query that fit the character budget, in document order.
+
+    Chunk text is sliced from `index['text']`, the paper's text or a reader of
+    it. Falls back to the opening chunks when no term in the query matches.
+    """
+    spans = index['spans']
+    matches = [chunk_id for chunk_id, _ in search(index, query, top_k)]
+    if not matches:
+        matches = list(range(min(top_k, len(spans))))
+    selected = []
+    used = 0
+    for chunk_id in matches:
+        length = int(spans[chunk_id][1] - spans[chunk_id][0])
+        if used + length > budget and selected:
+            continue
+        selected.append(chunk_id)
+        used += length
+    return [index['text'][int(spans[chunk_id][0]):int(spans[chunk_id][1])] for chunk_id in sorted(selected)]
@@ -0,0 +1,467 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+
+import numpy as np
+
+import config
+import metrics
+import chat_log
+import blob_store
+import paper_index
+import similarity_index
+
+LIBRARY_DB = "library.db"
+SCHEMA_VERSION = 6
+
+# Per-user library listings, rebuilt when the library is written to
+_index_cache = {}
+_similarity_cache = {}
+_generations = {}
+_index_lock = threading.Lock()
+
+
+def user_folder(username):
+    """Returns the folder holding a user's saved papers."""
+    return os.path.join(config.SAVED_PAPERS_DIR, username)
+
+
+def legacy_pdf_path(username, safe_title):
+    """Returns the path of a PDF stored in the user's folder before the shared blob store."""
+    return os.path.join(user_folder(username), f"{safe_title}.pdf")
+
+
+def chat_path(username, safe_title):
+    """Returns the append-only chat log path of a saved paper."""
+    return os.path.join(user_folder(username), f"{safe_title}.chat.jsonl")
+
+
+def legacy_chat_path(username, safe_title):
+    """Returns the path of a chat history in the old whole-file JSON format."""
+    return os.path.join(user_folder(username), f"{safe_title}.chat.json")
+
+
+def legacy_index_path(username, safe_title):
+    """Returns the path of a retrieval index stored in the user's folder before the shared blob store."""
+    return os.path.join(user_folder(username), f"{safe_title}.index.npz")
+
+
+def _migrate(conn, username):
+    """Brings a library database up to the current schema version."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    moved, acquired = [], []
+    try:
+        with conn:
+            # DDL doesn't open a transaction by itself, so take the write lock first: the whole
+            # migration then commits or rolls back as one, and a connection that raced us here
+            # sees the version the winner wrote
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS papers (
+                        safe_title TEXT PRIMARY KEY,
+                        title TEXT NOT NULL,
+                        authors TEXT NOT NULL,
+                        pdf_url TEXT,
+                        entry_id TEXT,
+                        published TEXT,
+                        summary TEXT,
+                        drawbacks TEXT,
+                        full_text TEXT,
+                        saved_at REAL NOT NULL
+                    )
+                """)
+            if version < 2:
+                conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+                        safe_title UNINDEXED, title, authors, summary, drawbacks, full_text
+                    )
+                """)
+                conn.execute("DELETE FROM papers_fts")
+                rows = conn.execute("SELECT rowid, safe_title, title, authors, summary, drawbacks, full_text FROM papers")
+                conn.executemany("""
+                    INSERT INTO papers_fts (rowid, safe_title, title, authors, summary, drawbacks, full_text)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [(row[0], row[1], row[2], ", ".join(json.loads(row[3])), *row[4:]) for row in rows])
+            if version < 3:
+                # Move PDFs and extracted text into the shared blob store; the library keeps references
+                conn.execute("ALTER TABLE papers ADD COLUMN pdf_sha256 TEXT")
+                conn.execute("ALTER TABLE papers ADD COLUMN text_sha256 TEXT")
+                for rowid, safe_title, entry_id, full_text in conn.execute(
+                        "SELECT rowid, safe_title, entry_id, full_text FROM papers").fetchall():
+                    legacy_pdf = legacy_pdf_path(username, safe_title)
+                    pdf_sha256 = blob_store.put_pdf(legacy_pdf) if os.path.exists(legacy_pdf) else None
+                    text_sha256 = blob_store.put_text(full_text or "")
+                    blob_store.acquire([pdf_sha256, text_sha256])
+                    acquired += [pdf_sha256, text_sha256]
+                    if pdf_sha256 and entry_id and full_text:
+                        blob_store.record_entry(entry_id, pdf_sha256, text_sha256)
+                    conn.execute("UPDATE papers SET pdf_sha256 = ?, text_sha256 = ?, full_text = NULL WHERE rowid = ?",
+                                 (pdf_sha256, text_sha256, rowid))
+                    moved += [legacy_pdf, legacy_index_path(username, safe_title)]
+            if version < 4:
+                # Filled in by load_similarity_index for papers saved before this version
+                conn.execute("ALTER TABLE papers ADD COLUMN vector BLOB")
+            if version < 5:
+                # Index the full text without keeping a copy per library: the FTS table reads its
+                # content through this view, which takes the text from the shared blob when needed
+                conn.execute("DROP TABLE IF EXISTS papers_fts")
+                conn.execute("""
+                    CREATE VIEW IF NOT EXISTS papers_fts_content AS
+                    SELECT rowid, safe_title, title, author_list(authors) AS authors, summary, drawbacks,
+                           blob_text(text_sha256) AS full_text
+                    FROM papers
+                """)
+                conn.execute("""
+                    CREATE VIRTUAL TABLE papers_fts USING fts5(
+                        safe_title UNINDEXED, title, authors, summary, drawbacks, full_text,
+                        content='papers_fts_content', content_rowid='rowid'
+                    )
+                """)
+                conn.execute("INSERT INTO papers_fts (papers_fts) VALUES ('rebuild')")
+            if version < 6:
+                # Vectors are now made from the stored abstract; load_similarity_index recomputes these
+                conn.execute("ALTER TABLE papers ADD COLUMN abstract TEXT")
+                conn.execute("UPDATE papers SET vector = NULL")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    except Exception:
+        # Blob references taken for a migration that rolled back would never be released
+        blob_store.release(acquired)
+        raise
+    for path in moved:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# SQL functions the papers_fts_content view is built from
+def _blob_text(text_sha256):
+    return blob_store.read_text(text_sha256) if text_sha256 else None
+
+
+def _author_list(authors_json):
+    return ", ".join(json.loads(authors_json))
+
+
+def _unindex(conn, rowid):
+    # An external-content FTS table only forgets a row when given the values it was indexed with
+    conn.execute("""
+        INSERT INTO papers_fts (papers_fts, rowid, safe_title, title, authors, summary, drawbacks, full_text)
+        SELECT 'delete', rowid, safe_title, title, authors, summary, drawbacks, full_text
+        FROM papers_fts_content WHERE rowid = ?
+    """, (rowid,))
+
+
+def _connect(username):
+    os.makedirs(user_folder(username), exist_ok=True)
+    conn = sqlite3.connect(os.path.join(user_folder(username), LIBRARY_DB), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.create_function("blob_text", 1, _blob_text, deterministic=True)
+    conn.create_function("author_list", 1, _author_list, deterministic=True)
+    _migrate(conn, username)
+    return conn
+
+
+def _similarity_vector(title, abstract, summary):
+    # Papers are compared on title and arXiv abstract wherever their vectors are made. Papers
+    # saved before abstracts were stored fall back to their generated summary.
+    return similarity_index.vectorize(title, abstract or summary)
+
+
+def _invalidate(username):
+    with _index_lock:
+        _generations[username] = _generations.get(username, 0) + 1
+
+
+def _index_signature(username):
+    db_path = os.path.join(user_folder(username), LIBRARY_DB)
+    mtimes = tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+                   for path in (db_path, f"{db_path}-wal"))
+    return _generations.get(username, 0), mtimes
+
+
+@metrics.timed("library_write")
+def save_paper(username, safe_title, paper, summary, drawbacks, full_text, pdf_sha256=None):
+    """Stores a saved paper's metadata and analysis, and indexes it for search.
+
+    The PDF (already in the blob store as `pdf_sha256`) and the extracted text
+    are shared between users; the library only holds references to them.
+    """
+    text_sha256 = blob_store.put_text(full_text)
+    # paper['summary'] is the arXiv abstract; `summary` is the generated one
+    abstract = paper.get('summary')
+    vector = _similarity_vector(paper['title'], abstract, summary)
+    blob_store.acquire([pdf_sha256, text_sha256])
+    try:
+        with closing(_connect(username)) as conn, conn:
+            old = conn.execute("SELECT rowid, pdf_sha256, text_sha256 FROM papers WHERE safe_title = ?",
+                               (safe_title,)).fetchone()
+            if old:
+                _unindex(conn, old['rowid'])
+            conn.execute("""
+                INSERT INTO papers
+                    (safe_title, title, authors, pdf_url, entry_id, published, abstract, summary, drawbacks, pdf_sha256,
+                     text_sha256, vector, saved_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (safe_title) DO UPDATE SET
+                    title = excluded.title, authors = excluded.authors, pdf_url = excluded.pdf_url,
+                    entry_id = excluded.entry_id, published = excluded.published, abstract = excluded.abstract,
+                    summary = excluded.summary, drawbacks = excluded.drawbacks, pdf_sha256 = excluded.pdf_sha256,
+                    text_sha256 = excluded.text_sha256, vector = excluded.vector, saved_at = excluded.saved_at
+            """, (safe_title, paper['title'], json.dumps(paper['authors']), paper.get('pdf_url'), paper.get('entry_id'),
+                  paper.get('published'), abstract, summary, drawbacks, pdf_sha256, text_sha256, vector.tobytes(),
+                  time.time()))
+            rowid = conn.execute("SELECT rowid FROM papers WHERE safe_title = ?", (safe_title,)).fetchone()[0]
+            conn.execute("""
+                INSERT INTO papers_fts (rowid, safe_title, title, authors, summary, drawbacks, full_text)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (rowid, safe_title, paper['title'], ", ".join(paper['authors']), summary, drawbacks, full_text))
+    except Exception:
+        blob_store.release([pdf_sha256, text_sha256])
+        raise
+    if old:
+        blob_store.release([old['pdf_sha256'], old['text_sha256']])
+    _invalidate(username)
+
+
+def list_papers(username):
+    """Returns the user's library index: safe title, title and PDF availability per paper.
+
+    The index is cached per process and rebuilt only after a write through
+    this module or a change to the library files by another process.
+    """
+    signature = _index_signature(username)
+    with _index_lock:
+        cached = _index_cache.get(username)
+        if cached and cached[0] == signature:
+            return cached[1]
+    if not os.path.exists(os.path.join(user_folder(username), LIBRARY_DB)):
+        papers = []
+    else:
+        with closing(_connect(username)) as conn:
+            rows = conn.execute("SELECT safe_title, title, pdf_sha256 FROM papers ORDER BY safe_title").fetchall()
+        papers = [{'safe_title': row['safe_title'], 'title': row['title'],
+                   'has_pdf': row['pdf_sha256'] is not None} for row in rows]
+    with _index_lock:
+        _index_cache[username] = (signature, papers)
+    return papers
+
+
+def saved_titles(username):
+    """Returns the set of safe titles in a user's library."""
+    return {paper['safe_title'] for paper in list_papers(username)}
+
+
+def load_similarity_index(username):
+    """Returns the user's related-papers index, cached like the library listing.
+
+    Papers saved without a vector, or with one of another SIMILARITY_DIM, are
+    vectorized here.
+    """
+    signature = _index_signature(username)
+    with _index_lock:
+        cached = _similarity_cache.get(username)
+        if cached and cached[0] == signature:
+            return cached[1]
+    entries = []
+    if os.path.exists(os.path.join(user_folder(username), LIBRARY_DB)):
+        with closing(_connect(username)) as conn:
+            rows = conn.execute("SELECT rowid, safe_title, title, entry_id, abstract, summary, vector FROM papers").fetchall()
+            backfill = []
+            for row in rows:
+                if row['vector'] is not None and len(row['vector']) == similarity_index.VECTOR_BYTES:
+                    vector = np.frombuffer(row['vector'], dtype=np.float32)
+                else:
+                    vector = _similarity_vector(row['title'], row['abstract'], row['summary'])
+                    backfill.append((vector.tobytes(), row['rowid']))
+                entries.append((row['safe_title'], row['title'], row['entry_id'], vector))
+            if backfill:
+                with conn:
+                    conn.executemany("UPDATE papers SET vector = ? WHERE rowid = ?", backfill)
+                signature = _index_signature(username)
+    index = similarity_index.build(entries)
+    with _index_lock:
+        _similarity_cache[username] = (signature, index)
+    return index
+
+
+def related_papers(username, papers, top_k=config.RELATED_TOP_K):
+    """Finds the saved papers most similar to each of `papers`, flagging likely duplicates.
+
+    `papers` are dicts with a title, an abstract or summary and optionally an
+    entry_id and safe_title; a saved paper is never reported as related to
+    itself. Returns one list per paper of dicts with the safe title, title,
+    similarity and a `duplicate` flag. Other saved versions of the same arXiv
+    entry always come first, flagged, however they rank; other papers are
+    flagged at a similarity of at least NEAR_DUPLICATE_SIMILARITY.
+    """
+    index = load_similarity_index(username)
+    if not papers:
+        return []
+    vectors = np.stack([_similarity_vector(paper['title'], paper.get('abstract'), paper.get('summary'))
+                        for paper in papers])
+    related = []
+    for paper, vector, matches in zip(papers, vectors, similarity_index.search(index, vectors, top_k + 1)):
+        versions = index['rows_by_arxiv_id'].get(similarity_index.arxiv_id(paper.get('entry_id')), [])
+        same_entry = [row for row in versions if index['safe_titles'][row] != paper.get('safe_title')]
+        hits = [(row, float(vector @ index['vectors'][row]), True) for row in same_entry]
+        for row, score in matches:
+            if index['safe_titles'][row] == paper.get('safe_title') or row in same_entry:
+                continue
+            if score >= config.RELATED_MIN_SIMILARITY:
+                hits.append((row, score, score >= config.NEAR_DUPLICATE_SIMILARITY))
+        related.append([{
+            'safe_title': index['safe_titles'][row],
+            'title': index['titles'][row],
+            'similarity': score,
+            'duplicate': duplicate,
+        } for row, score, duplicate in hits[:max(top_k, len(same_entry))]])
+    return related
+
+
+def load_paper(username, safe_title):
+    """Loads a saved paper's metadata, abstract, summary and drawbacks, without the full text."""
+    with closing(_connect(username)) as conn:
+        row = conn.execute("""
+            SELECT safe_title, title, authors, pdf_url, entry_id, published, abstract, summary, drawbacks, pdf_sha256
+            FROM papers WHERE safe_title = ?
+        """, (safe_title,)).fetchone()
+    if row is None:
+        return None
+    paper = dict(row)
+    paper['authors'] = json.loads(paper['authors'])
+    paper['published'] = paper['published'] or 'N/A'
+    pdf_sha256 = paper.pop('pdf_sha256')
+    if pdf_sha256 and os.path.exists(blob_store.path(blob_store.PDF, pdf_sha256)):
+        paper['pdf_local_path'] = blob_store.path(blob_store.PDF, pdf_sha256)
+    return paper
+
+
+def _blob_hashes(username, safe_title):
+    with closing(_connect(username)) as conn:
+        row = conn.execute("SELECT pdf_sha256, text_sha256 FROM papers WHERE safe_title = ?", (safe_title,)).fetchone()
+    return (row['pdf_sha256'], row['text_sha256']) if row else (None, None)
+
+
+def load_full_text(username, safe_title):
+    """Loads the extracted full text of a saved paper."""
+    text_sha256 = _blob_hashes(username, safe_title)[1]
+    return blob_store.read_text(text_sha256) if text_sha256 else ""
+
+
+def load_index(username, safe_title):
+    """Loads a saved paper's retrieval index, building it first for papers saved without one.
+
+    The index's `text` is the shared reader of the paper's stored text, so
+    retrieval decompresses only the chunks it returns.
+    """
+    text_sha256 = _blob_hashes(username, safe_title)[1]
+    if not text_sha256:
+        return {**paper_index.build_index(""), 'text': ""}
+    path = blob_store.index_path(text_sha256)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        paper_index.save_index(path, paper_index.build_index(blob_store.read_text(text_sha256)))
+    return {**paper_index.load_index(path), 'text': blob_store.open_text(text_sha256)}
+
+
+def delete_paper(username, safe_title):
+    """Removes a paper and its chat history from a user's library and releases its shared PDF and text."""
+    with closing(_connect(username)) as conn, conn:
+        row = conn.execute("SELECT rowid, pdf_sha256, text_sha256 FROM papers WHERE safe_title = ?", (safe_title,)).fetchone()
+        if row:
+            _unindex(conn, row[0])
+            conn.execute("DELETE FROM papers WHERE rowid = ?", (row[0],))
+    if row:
+        blob_store.release([row['pdf_sha256'], row['text_sha256']])
+    if os.path.exists(legacy_chat_path(username, safe_title)):
+        os.remove(legacy_chat_path(username, safe_title))
+    chat_log.clear(chat_path(username, safe_title))
+    _invalidate(username)
+    blob_store.collect()
+
+
+def _fts_query(query):
+    """Turns free text into an FTS5 query: all terms must match, the last one as a prefix."""
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_library(username, query, limit=20):
+    """Full-text searches a user's library. Returns ranked papers with a highlighted snippet."""
+    fts_query = _fts_query(query)
+    if not fts_query or not os.path.exists(os.path.join(user_folder(username), LIBRARY_DB)):
+        return []
+    with closing(_connect(username)) as conn:
+        rows = conn.execute("""
+            SELECT safe_title, title, snippet(papers_fts, -1, '**', '**', '…', 16) AS snippet
+            FROM papers_fts WHERE papers_fts MATCH ?
+            ORDER BY bm25(papers_fts, 0.0, 10.0, 5.0, 3.0, 2.0, 1.0)
+            LIMIT ?
+        """, (fts_query, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def read_pdf(username, safe_title):
+    """Reads a saved paper's PDF bytes."""
+    with open(blob_store.path(blob_store.PDF, _blob_hashes(username, safe_title)[0]), "rb") as f:
+        return f.read()
+
+
+# --- Migration from the .txt format ---
+def _parse_txt(content):
+    lines = content.split("\n", 3)
+    summary_part, rest = content.split("--- Summary ---", 1)[1].split("--- Drawbacks ---", 1)
+    drawbacks_part, full_text = rest.split("--- Full Text ---", 1)
+    paper = {
+        'title': lines[0].replace("Title: ", ""),
+        'authors': lines[1].replace("Authors: ", "").split(", "),
+        'pdf_url': lines[2].replace("PDF_URL: ", ""),
+    }
+    return paper, summary_part.strip(), drawbacks_part.strip(), full_text.strip()
+
+
+def migrate_txt_library(username):
+    """Moves a user's legacy `<title>.txt` papers into the library store. Returns the number migrated."""
+    folder = user_folder(username)
+    if not os.path.isdir(folder):
+        return 0
+    migrated = 0
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith(".txt"):
+            continue
+        txt_path = os.path.join(folder, filename)
+        with open(txt_path, "r") as f:
+            content = f.read()
+        try:
+            paper, summary, drawbacks, full_text = _parse_txt(content)
+        except (IndexError, ValueError):
+            print(f"Could not parse saved paper file {txt_path}; leaving it in place.")
+            continue
+        safe_title = os.path.splitext(filename)[0]
+        # The PDF saved alongside moves into the blob store, as in the schema migration
+        legacy_pdf = legacy_pdf_path(username, safe_title)
+        pdf_sha256 = blob_store.put_pdf(legacy_pdf) if os.path.exists(legacy_pdf) else None
+        save_paper(username, safe_title, paper, summary, drawbacks, full_text, pdf_sha256)
+        os.remove(txt_path)
+        for path in (legacy_pdf, legacy_index_path(username, safe_title)):
+            if os.path.exists(path):
+                os.remove(path)
+        migrated += 1
+    return migrated
+
+
+if __name__ == "__main__":
+    if os.path.isdir(config.SAVED_PAPERS_DIR):
+        for name in sorted(os.listdir(config.SAVED_PAPERS_DIR)):
+            if os.path.isdir(os.path.join(config.SAVED_PAPERS_DIR, name)):
+                count = migrate_txt_library(name)
+                print(f"{name}: migrated {count} papers")
@@ -0,0 +1,198 @@
+import os
+import signal
+import sqlite3
+import hashlib
+import threading
+import multiprocessing
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+import metrics
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PageTimeout(Exception):
+    pass
+
+
+def _connect():
+    os.makedirs(os.path.dirname(config.PAGE_CACHE_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(config.PAGE_CACHE_DB, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pages (
+            pdf_sha256 TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (pdf_sha256, page)
+        )
+    """)
+    return conn
+
+
+def file_sha256(path):
+    """Returns the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=config.EXTRACT_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _on_page_timeout(signum, frame):
+    raise PageTimeout()
+
+
+def _extract_range(pdf_path, pages, page_timeout=0, on_page=None):
+    """Extracts a list of pages, returning (page, text) pairs. Failed pages come back as None."""
+    from PyPDF2 import PdfReader
+    use_alarm = page_timeout and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_page_timeout)
+    reader = PdfReader(pdf_path)
+    extracted = []
+    for page in pages:
+        try:
+            if use_alarm:
+                signal.alarm(page_timeout)
+            text = reader.pages[page].extract_text() or ""
+        except PageTimeout:
+            print(f"Skipping page {page} of {pdf_path}: extraction timed out")
+            text = None
+        except Exception as e:
+            print(f"Skipping page {page} of {pdf_path}: {e}")
+            text = None
+        finally:
+            if use_alarm:
+                signal.alarm(0)
+        extracted.append((page, text))
+        if on_page is not None:
+            on_page(page, text)
+    return extracted
+
+
+def _extract_in_thread(pdf_path, pages, page_timeout):
+    """Extracts pages in this process, skipping any page that takes longer than page_timeout.
+
+    SIGALRM only works on the main thread, so extraction runs on a helper thread
+    that is watched instead. A stuck thread can't be killed; it is abandoned, its
+    page is reported as failed and a new thread carries on with the pages after it.
+    """
+    extracted = {}
+    progress = threading.Condition()
+    remaining = list(pages)
+    while remaining:
+        batch, finished = remaining, []
+
+        def on_page(page, text, extracted=extracted):
+            with progress:
+                extracted[page] = text
+                progress.notify()
+
+        def run(batch=batch, finished=finished, on_page=on_page):
+            try:
+                _extract_range(pdf_path, batch, on_page=on_page)
+            except Exception as e:
+                print(f"Error extracting {pdf_path}: {e}")
+            finally:
+                with progress:
+                    finished.append(True)
+                    progress.notify()
+
+        with progress:
+            threading.Thread(target=run, daemon=True, name="pdf-extract").start()
+            while not finished and progress.wait(timeout=page_timeout):
+                pass
+            pending = [page for page in batch if page not in extracted]
+            if finished or not pending:
+                break
+            stuck, *remaining = pending
+            print(f"Skipping page {stuck} of {pdf_path}: extraction timed out")
+            # The abandoned thread may still report pages, so later results go to a fresh dict
+            extracted = {**extracted, stuck: None}
+    return [(page, extracted.get(page)) for page in pages]
+
+
+def iter_pages(pdf_path, pdf_sha256=None):
+    """Yields (page, text) pairs as they become available, cached pages first.
+
+    Long documents are split into page ranges and extracted on a process pool.
+    Pages that raise or exceed EXTRACT_PAGE_TIMEOUT are yielded as empty text
+    and left out of the cache, so the next extraction of the PDF retries them.
+    """
+    # PyPDF2 is imported on first extraction rather than at app startup
+    from PyPDF2 import PdfReader
+    pdf_sha256 = pdf_sha256 or file_sha256(pdf_path)
+    page_count = len(PdfReader(pdf_path).pages)
+
+    with closing(_connect()) as conn:
+        cached = dict(conn.execute("SELECT page, text FROM pages WHERE pdf_sha256 = ?", (pdf_sha256,)))
+    yield from sorted(cached.items())
+
+    missing = [page for page in range(page_count) if page not in cached]
+    if not missing:
+        return
+
+    for extracted in _extract_missing(pdf_path, missing):
+        with closing(_connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO pages (pdf_sha256, page, text) VALUES (?, ?, ?)",
+                             [(pdf_sha256, page, text) for page, text in extracted if text is not None])
+        yield from ((page, text or "") for page, text in extracted)
+
+
+def _extract_missing(pdf_path, missing):
+    if len(missing) < config.EXTRACT_MIN_PARALLEL_PAGES:
+        yield _extract_in_thread(pdf_path, missing, config.EXTRACT_PAGE_TIMEOUT)
+        return
+
+    size = config.EXTRACT_PAGES_PER_TASK
+    batches = [missing[i:i + size] for i in range(0, len(missing), size)]
+    pool = _get_pool()
+    try:
+        futures = {pool.submit(_extract_range, pdf_path, batch, config.EXTRACT_PAGE_TIMEOUT): batch for batch in batches}
+    except BrokenProcessPool:
+        _reset_pool()
+        yield _extract_in_thread(pdf_path, missing, config.EXTRACT_PAGE_TIMEOUT)
+        return
+
+    deadline = config.EXTRACT_PAGE_TIMEOUT * size * len(batches) + 30
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                _reset_pool()
+                yield _extract_in_thread(pdf_path, futures[future], config.EXTRACT_PAGE_TIMEOUT)
+    except TimeoutError:
+        print(f"Extraction of {pdf_path} timed out; skipping unfinished pages")
+        _reset_pool()
+        for future, batch in futures.items():
+            if not future.done():
+                yield [(page, None) for page in batch]
+
+
+@metrics.timed("pdf_extract")
+def extract_text(pdf_path, pdf_sha256=None):
+    """Returns the full text of a PDF, with pages in document order."""
+    pages = dict(iter_pages(pdf_path, pdf_sha256))
+    return "".join(pages[page] for page in sorted(pages))
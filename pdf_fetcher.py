@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+import metrics
+
+CHUNK_SIZE = 64 * 1024
+RETRYABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+_url_locks = {}
+_url_locks_guard = threading.Lock()
+
+
+def _create_session():
+    session = requests.Session()
+    # The adapter only retries throttling and server errors; fetch_pdf retries dropped
+    # connections itself so the download resumes, and two layers would multiply the attempts
+    retry = Retry(
+        total=config.PDF_FETCH_RETRIES,
+        connect=0,
+        read=0,
+        other=0,
+        status=config.PDF_FETCH_RETRIES,
+        backoff_factor=config.PDF_FETCH_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.PDF_FETCH_POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+session = _create_session()
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def _url_lock(url):
+    with _url_locks_guard:
+        return _url_locks.setdefault(url, threading.Lock())
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def blob_path(sha256):
+    """Returns the cache path of a PDF with the given content hash."""
+    return os.path.join(config.PDF_CACHE_DIR, f"{sha256}.pdf")
+
+
+def cached_path(url):
+    """Returns the cached PDF path for a URL without touching the network, or None."""
+    meta = _read_json(os.path.join(config.PDF_CACHE_DIR, "urls", f"{_url_key(url)}.json"))
+    if meta and os.path.exists(blob_path(meta['sha256'])):
+        return blob_path(meta['sha256'])
+    return None
+
+
+def evict(hashes):
+    """Deletes the cached PDFs with the given content hashes, and the URL records pointing at them."""
+    hashes = set(hashes)
+    for sha256 in hashes:
+        if os.path.exists(blob_path(sha256)):
+            os.remove(blob_path(sha256))
+    urls_dir = os.path.join(config.PDF_CACHE_DIR, "urls")
+    if not hashes or not os.path.isdir(urls_dir):
+        return
+    for name in os.listdir(urls_dir):
+        meta_path = os.path.join(urls_dir, name)
+        meta = _read_json(meta_path) if name.endswith(".json") else None
+        if meta and meta.get('sha256') in hashes:
+            os.remove(meta_path)
+
+
+def fetch_pdf(url):
+    """Returns the path of a locally cached copy of the PDF at `url`.
+
+    Downloads are streamed to disk and resumed with range requests after
+    dropped connections. Cached copies are revalidated with conditional
+    requests once they are older than PDF_CACHE_MAX_AGE.
+    """
+    os.makedirs(os.path.join(config.PDF_CACHE_DIR, "urls"), exist_ok=True)
+    os.makedirs(os.path.join(config.PDF_CACHE_DIR, "partial"), exist_ok=True)
+    key = _url_key(url)
+    meta_path = os.path.join(config.PDF_CACHE_DIR, "urls", f"{key}.json")
+
+    with _url_lock(url):
+        meta = _read_json(meta_path)
+        if meta and os.path.exists(blob_path(meta['sha256'])):
+            if time.time() - meta['checked'] < config.PDF_CACHE_MAX_AGE:
+                return blob_path(meta['sha256'])
+            try:
+                if not _is_modified(url, meta):
+                    meta['checked'] = time.time()
+                    _write_json(meta_path, meta)
+                    return blob_path(meta['sha256'])
+            except requests.exceptions.RequestException as e:
+                print(f"Could not revalidate cached PDF {url}: {e}")
+                return blob_path(meta['sha256'])
+
+        for attempt in range(config.PDF_FETCH_RETRIES + 1):
+            try:
+                meta = _download(url, key)
+                break
+            except RETRYABLE_ERRORS:
+                if attempt == config.PDF_FETCH_RETRIES:
+                    raise
+                time.sleep(config.PDF_FETCH_BACKOFF * 2 ** attempt)
+        _write_json(meta_path, meta)
+        return blob_path(meta['sha256'])
+
+
+def _is_modified(url, meta):
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    if not headers:
+        return False
+    with session.get(url, headers=headers, stream=True, timeout=config.PDF_FETCH_TIMEOUT) as response:
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        return True
+
+
+@metrics.timed("pdf_download")
+def _download(url, key):
+    part_path = os.path.join(config.PDF_CACHE_DIR, "partial", f"{key}.part")
+    part_meta_path = f"{part_path}.json"
+    part_meta = _read_json(part_meta_path) or {}
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    headers = {}
+    validator = part_meta.get('etag') or part_meta.get('last_modified')
+    if offset and validator:
+        headers['Range'] = f"bytes={offset}-"
+        headers['If-Range'] = validator
+
+    with session.get(url, headers=headers, stream=True, timeout=config.PDF_FETCH_TIMEOUT) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            offset = 0
+        part_meta = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        _write_json(part_meta_path, part_meta)
+
+        digest = hashlib.sha256()
+        if offset:
+            with open(part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        with open(part_path, "ab" if offset else "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                digest.update(chunk)
+
+    sha256 = digest.hexdigest()
+    os.replace(part_path, blob_path(sha256))
+    os.remove(part_meta_path)
+    return {'sha256': sha256, 'checked': time.time(), **part_meta}
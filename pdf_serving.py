@@ -0,0 +1,59 @@
+import os
+import base64
+import shutil
+import threading
+
+import config
+import pdf_extract
+
+STATIC_URL_PREFIX = "app/static/pdfs"
+
+_published = {}
+_published_lock = threading.Lock()
+
+
+def publish(pdf_path):
+    """Exposes a PDF through Streamlit's static file route and returns its URL.
+
+    Files are published under their content hash, so each PDF is hard-linked
+    (or copied) into the static folder once and browsers can cache it.
+    """
+    mtime = os.stat(pdf_path).st_mtime_ns
+    with _published_lock:
+        cached = _published.get(pdf_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    sha256 = pdf_extract.file_sha256(pdf_path)
+    static_path = os.path.join(config.STATIC_PDF_DIR, f"{sha256}.pdf")
+    if not os.path.exists(static_path):
+        os.makedirs(config.STATIC_PDF_DIR, exist_ok=True)
+        tmp_path = f"{static_path}.tmp"
+        try:
+            os.link(pdf_path, tmp_path)
+        except OSError:
+            shutil.copyfile(pdf_path, tmp_path)
+        os.replace(tmp_path, static_path)
+
+    url = f"{STATIC_URL_PREFIX}/{sha256}.pdf"
+    with _published_lock:
+        _published[pdf_path] = (mtime, url)
+    return url
+
+
+def unpublish(hashes):
+    """Removes published PDFs with the given content hashes from the static folder."""
+    urls = {f"{STATIC_URL_PREFIX}/{sha256}.pdf" for sha256 in hashes}
+    for sha256 in hashes:
+        static_path = os.path.join(config.STATIC_PDF_DIR, f"{sha256}.pdf")
+        if os.path.exists(static_path):
+            os.remove(static_path)
+    with _published_lock:
+        for pdf_path in [path for path, (_, url) in _published.items() if url in urls]:
+            del _published[pdf_path]
+
+
+def data_uri(pdf_path):
+    """Returns the PDF inlined as a base64 data URI, for servers without static serving."""
+    with open(pdf_path, "rb") as f:
+        return f"data:application/pdf;base64,{base64.b64encode(f.read()).decode('utf-8')}"
@@ -0,0 +1,134 @@
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing
+from collections import OrderedDict
+
+import config
+
+
+def make_key(query, start_date, end_date, max_results, sort_by):
+    """Builds a normalized cache key for an arXiv search.
+
+    Only whitespace is normalized: arXiv's AND/OR/ANDNOT operators are case-sensitive.
+    """
+    normalized_query = " ".join(query.split())
+    start = start_date.isoformat() if start_date else ""
+    end = end_date.isoformat() if end_date else ""
+    sort_name = getattr(sort_by, "name", str(sort_by))
+    raw = "|".join([normalized_query, start, end, str(int(max_results)), sort_name])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """An LRU, TTL-bounded cache of search results with an on-disk tier."""
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    created REAL NOT NULL,
+                    results BLOB NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _expired(self, created):
+        return time.time() - created > self.ttl
+
+    def get(self, key):
+        """Returns cached results for a key, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and not self._expired(entry[0]):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute("SELECT created, results FROM search_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading search cache: {e}")
+            row = None
+
+        results = None
+        if row and not self._expired(row[0]):
+            try:
+                results = pickle.loads(row[1])
+            except Exception as e:
+                # A corrupt row or one pickled by an incompatible arxiv version; drop it and search again
+                print(f"Discarding unreadable search cache entry: {e}")
+                self._delete(key)
+
+        with self._lock:
+            if results is not None:
+                self._store_in_memory(key, row[0], results)
+                self.hits += 1
+                return results
+            self.misses += 1
+        return None
+
+    def _delete(self, key):
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            print(f"Error writing search cache: {e}")
+
+    def put(self, key, results):
+        """Stores results in both the memory and the disk tier."""
+        created = time.time()
+        with self._lock:
+            self._store_in_memory(key, created, results)
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("INSERT OR REPLACE INTO search_cache (key, created, results) VALUES (?, ?, ?)",
+                             (key, created, pickle.dumps(results)))
+                conn.execute("DELETE FROM search_cache WHERE created < ?", (created - self.ttl,))
+                conn.execute("""
+                    DELETE FROM search_cache WHERE key NOT IN (
+                        SELECT key FROM search_cache ORDER BY created DESC LIMIT ?
+                    )
+                """, (self.max_entries,))
+        except sqlite3.Error as e:
+            print(f"Error writing search cache: {e}")
+
+    def _store_in_memory(self, key, created, results):
+        self._memory[key] = (created, results)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """Returns hit/miss counters for the cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._memory),
+            }
+
+
+cache = SearchCache(
+    os.path.join(config.CACHE_DIR, "search_cache.db"),
+    ttl=config.SEARCH_CACHE_TTL,
+    max_entries=config.SEARCH_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,77 @@
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+import config
+import paper_index
+
+TITLE_WEIGHT = 2
+VECTOR_BYTES = config.SIMILARITY_DIM * np.dtype(np.float32).itemsize
+
+
+def vectorize(title, text=""):
+    """Returns the unit-length hashed unigram and bigram vector of a paper's title and text.
+
+    Terms are hashed with a stable hash into SIMILARITY_DIM signed buckets, so
+    vectors need no shared vocabulary and each paper is vectorized on its own.
+    """
+    counts = Counter()
+    for weight, part in ((TITLE_WEIGHT, title), (1, text)):
+        tokens = paper_index.tokenize(part or "")
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            counts[feature] += weight
+    vector = np.zeros(config.SIMILARITY_DIM, dtype=np.float32)
+    if not counts:
+        return vector
+    hashes = np.array([zlib.crc32(feature.encode("utf-8")) for feature in counts], dtype=np.uint32)
+    weights = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    # The top hash bit picks the sign, so colliding terms tend to cancel out rather than add up
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, hashes % config.SIMILARITY_DIM, signs * weights)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def arxiv_id(entry_id):
+    """Returns the arXiv ID of an entry without its version, so all versions of a paper share it."""
+    return re.sub(r"v\d+$", "", (entry_id or "").split("/abs/")[-1])
+
+
+def build(entries):
+    """Stacks (safe_title, title, entry_id, vector) entries into an index.
+
+    `rows_by_arxiv_id` maps each arXiv ID to the rows holding a version of it,
+    for finding duplicates without relying on their similarity.
+    """
+    arxiv_ids = [arxiv_id(entry[2]) for entry in entries]
+    rows_by_arxiv_id = {}
+    for row, paper_arxiv_id in enumerate(arxiv_ids):
+        if paper_arxiv_id:
+            rows_by_arxiv_id.setdefault(paper_arxiv_id, []).append(row)
+    return {
+        'safe_titles': [entry[0] for entry in entries],
+        'titles': [entry[1] for entry in entries],
+        'arxiv_ids': arxiv_ids,
+        'rows_by_arxiv_id': rows_by_arxiv_id,
+        'vectors': (np.stack([entry[3] for entry in entries]) if entries
+                    else np.zeros((0, config.SIMILARITY_DIM), dtype=np.float32)),
+    }
+
+
+def search(index, vectors, top_k):
+    """Returns, per query vector, the (row, cosine similarity) pairs of the `top_k` closest entries."""
+    vectors = np.atleast_2d(vectors)
+    count = len(index['safe_titles'])
+    if not count:
+        return [[] for _ in vectors]
+    scores = vectors @ index['vectors'].T
+    top_k = min(top_k, count)
+    # Partition first so a query against a large index sorts only its best candidates
+    candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    matches = []
+    for row_scores, rows in zip(scores, candidates):
+        rows = rows[np.argsort(-row_scores[rows], kind="stable")]
+        matches.append([(int(row), float(row_scores[row])) for row in rows])
+    return matches
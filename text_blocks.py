@@ -0,0 +1,101 @@
+import mmap
+import zlib
+import struct
+import threading
+from collections import OrderedDict
+
+import config
+
+# File layout: header, then n_blocks + 1 little-endian u64 offsets of the
+# compressed blocks (relative to the end of the offset table), then the blocks.
+# Every block holds `block_chars` characters of text, UTF-8 encoded and
+# deflated on its own, so any character range decompresses independently.
+MAGIC = b"ZTXT1\0"
+_HEADER = struct.Struct("<6sIQI")  # magic, block_chars, total_chars, n_blocks
+
+_readers = OrderedDict()
+_readers_lock = threading.Lock()
+
+
+def write(path, text, block_chars=config.TEXT_BLOCK_CHARS, level=config.TEXT_COMPRESSION_LEVEL):
+    """Writes text as independently compressed blocks of `block_chars` characters."""
+    blocks = [zlib.compress(text[start:start + block_chars].encode("utf-8"), level)
+              for start in range(0, len(text), block_chars)]
+    offsets = [0]
+    for block in blocks:
+        offsets.append(offsets[-1] + len(block))
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, block_chars, len(text), len(blocks)))
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        for block in blocks:
+            f.write(block)
+
+
+class Reader:
+    """Reads character ranges of a block-compressed text file through a read-only memory map.
+
+    The mapping is shared page cache, so many sessions reading the same paper
+    don't each hold a copy; only the blocks covering a range are decompressed.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.block_chars, self.length, n_blocks = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a block-compressed text file")
+        table_start = _HEADER.size
+        self._data_start = table_start + 8 * (n_blocks + 1)
+        self._offsets = struct.unpack_from(f"<{n_blocks + 1}Q", self._map, table_start)
+
+    def __len__(self):
+        return self.length
+
+    def _block(self, i):
+        start = self._data_start + self._offsets[i]
+        end = self._data_start + self._offsets[i + 1]
+        return zlib.decompress(self._map[start:end]).decode("utf-8")
+
+    def read(self, start=0, end=None):
+        """Returns the text between two character offsets, decompressing only the blocks they span."""
+        end = self.length if end is None else min(end, self.length)
+        start = max(start, 0)
+        if start >= end:
+            return ""
+        first, last = start // self.block_chars, (end - 1) // self.block_chars
+        text = "".join(self._block(i) for i in range(first, last + 1))
+        offset = first * self.block_chars
+        return text[start - offset:end - offset]
+
+    def __getitem__(self, span):
+        # Lets readers stand in for a str where text is only ever sliced
+        if not isinstance(span, slice) or span.step not in (None, 1):
+            raise TypeError("text readers only support contiguous slices")
+        return self.read(span.start or 0, span.stop)
+
+    def close(self):
+        self._map.close()
+
+
+def open_reader(path):
+    """Returns the process-wide reader of a block-compressed text file, opening it on first use.
+
+    Files are content-addressed and never rewritten, so readers are kept
+    until TEXT_READER_CACHE_SIZE others have been used more recently.
+    """
+    with _readers_lock:
+        reader = _readers.get(path)
+        if reader is not None:
+            _readers.move_to_end(path)
+            return reader
+    reader = Reader(path)
+    with _readers_lock:
+        if path in _readers:
+            reader.close()
+            return _readers[path]
+        _readers[path] = reader
+        # Evicted readers are left for the garbage collector to unmap, as other threads may still be reading them
+        while len(_readers) > config.TEXT_READER_CACHE_SIZE:
+            _readers.popitem(last=False)
+    return reader